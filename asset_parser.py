@@ -5,38 +5,108 @@
 """ Mapster32 Asset Count Parser
 Parses and aggregates the statistics as output by the `dump_used_assets.m32` script in verbose mode.
 Said script is part of the eduke32 package, and can be found in the main eduke32 repository.
-Statistics can be output as an sqlite database, as xlsx or as csv.
+Statistics can be output as an sqlite database, as xlsx, as csv, or as binary npz or parquet datasets.
+Alternatively, the statistics can be computed from the MAP files directly, without mapster32 (see map_reader.py).
+Every run also writes an index of the maps that use each tile and sound, which can be searched with `query`.
 ------------------------------------------------------------------------------------------
-Usage: asset_parser.py <logfile> (sqlite|xlsx|csv) [--maxtiles <max_tiles>] [--use_extra_stats]
+Usage: asset_parser.py <logfile> (sqlite|xlsx|csv|npz|parquet) [--maxtiles <max_tiles>] [--use_extra_stats] [--stream|--mmap|--jobs <jobs>|--checkpoint <file>|--out_of_core <dir>|--follow] [--cache <file>] [--cache_size <mb>] [--poll <seconds>] [--bulk_db] [--normalized] [--profile <report>] [--tracemalloc] [--constant_memory] [--nonzero_rows] [--index <file>]
+       asset_parser.py maps (sqlite|xlsx|csv|npz|parquet) <mapfile>... [--names <names_h>] [--jobs <jobs>] [--chunksize <maps>] [--cache <file>] [--cache_size <mb>] [--maxtiles <max_tiles>] [--use_extra_stats] [--bulk_db] [--normalized] [--profile <report>] [--tracemalloc] [--constant_memory] [--nonzero_rows] [--index <file>]
+       asset_parser.py query (tile|sound) <first> [<last>] [--index <file>]
        asset_parser.py --help -h
        asset_parser.py --version
 Required Arguments:
     logfile            Mapster32 log file path that contains the statistics to parse
     sqlite|xlsx|csv    Output statistics as an SQLite database, an Excel document or as multiple CSV files.
+    npz|parquet        Output the statistics of all maps as a single binary dataset: either dense tensors in an
+                       uncompressed npz archive that can be memory-mapped (see load_stats_npz), or as Parquet
+                       files that only store the tiles and sounds used per map (requires pyarrow).
+    maps               Read the given Build MAP files of versions 7 to 9 instead of a mapster32 log. GRP and ZIP
+                       archives are read without extracting them, and all maps inside are counted. Directories
+                       are searched recursively for maps and archives, and glob patterns such as 'maps/**/*.map'
+                       are expanded. Maps that cannot be read are listed in maps_failed.txt.
+    query              Look up the maps that use the given tile or sound number, or the range of numbers from
+                       <first> to <last>, in the index written by the last run. Does not parse the log.
 Options:
     --maxtiles -m <max_tiles>   Defines the maximum expected tilenum. [default: 8192]
     --use_extra_stats -u        Looks for additional stats files and includes them. [default: 1]
+    --stream -s                 Count tiles and sounds while reading the log, without storing the log lines.
+    --mmap                      Memory-map the log and scan it as raw bytes, tolerating non-UTF-8 map paths.
+    --jobs -j <jobs>            Like --mmap, but split the log at map boundaries and count the maps with N processes.
+                                With maps, count the map files with N processes.
+    --chunksize <maps>          With maps and --jobs, number of maps sent to a worker process at once. [default: 16]
+    --checkpoint -c <file>      Like --mmap, but only parse the maps appended to the log since the run that wrote
+                                the checkpoint file, and only rewrite their outputs. xlsx, npz and parquet outputs are always
+                                rewritten entirely.
+    --out_of_core <dir>         Like --mmap, but write the statistics of each map to disk-backed arrays in the given
+                                directory as soon as it is counted, and read them back during the export. Memory usage
+                                then does not depend on the number of maps. The arrays are kept after the run.
+    --cache <file>              With maps, --mmap or --jobs, store the statistics of each map in this cache database,
+                                keyed by a hash of the map file or of its blocks in the log. Maps whose contents are
+                                already in the cache are not counted again, even if their name differs.
+    --cache_size <mb>           Size limit of the cache in MiB, the least recently used maps are evicted. [default: 256]
+    --names <names_h>           With maps, the names.h of the game, which defines the picnums of the actors and tiles
+                                that play sounds. Sounds are not counted if the file does not exist. [default: ./names.h]
+    --follow -f                 Keep reading the log while mapster32 writes to it, until interrupted with Ctrl+C.
+                                Each time the searches of a map are finished, only the tables of that map are
+                                updated, and the totals once all new lines are read. Only for sqlite output.
+    --poll <seconds>            With --follow, seconds between checks for new lines in the log. [default: 1.0]
+    --bulk_db -b                Use journal_mode=WAL and synchronous=OFF for faster SQLite bulk loads.
+                                The database may be corrupted if the system crashes during the export.
+    --normalized -n             Write the SQLite statistics into shared tables that only store nonzero counts,
+                                instead of two tables per map. See databases/normalized.sql.
+    --profile -p <report>       Time each phase of the run and write the timings, line and map counts, and peak
+                                memory usage as a JSON report.
+    --tracemalloc               With --profile, also report the peak traced memory and top allocations of each phase.
+    --constant_memory           For xlsx, stream the rows to disk with xlsxwriter instead of building the workbook
+                                with pandas in memory. Adds a summary sheet with the totals over all maps, the number
+                                of maps using each index, and the extra stats, in place of the total sheet.
+    --nonzero_rows              For xlsx, only write the rows with a nonzero total. Implies --constant_memory.
+    --index -i <file>           Path of the index of the maps that use each tile and sound. [default: ./asset_index.npz]
 """
 
 import sys
 import os
 import re
 import sqlite3
+import csv
 import pickle
+import mmap
+import hashlib
+import json
+import time
+import contextlib
+import tracemalloc
+import struct
+import zipfile
+import itertools
+import importlib.util
+
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Mapping
 
-import pandas as pd
 import numpy as np
 
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, NamedTuple, Iterator, Iterable, Callable, Union
 
 from docopt import docopt
 
+from indicator_store import IndicatorStore, INDICATOR_EXT
+from map_reader import read_map, tile_picnums
+from sound_rules import SoundRules, sound_hits
+from containers import expand_map_paths, is_container, iter_map_sources, open_container
+from result_cache import ResultCache
+
 TILE_SCHEMA = "./databases/tiles.sql"
 SOUND_SCHEMA = "./databases/sounds.sql"
+NORMALIZED_SCHEMA = "./databases/normalized.sql"
 DBPATH = "./databases/asset_stats.sqlite"
+NPZ_PATH = "./asset_stats.npz"
 
 __version__ = "2.1"
 
+# Version of the checkpoint state written by --checkpoint. Checkpoints of other versions are ignored.
+CHECKPOINT_VERSION = 4
+
 # Indicates the start of a map in the log. Comes in several variations depending on version and corruption.
 mapload_pattern = re.compile("Loaded V[0-9]+ map (.*) (successfully|\(EXTREME corruption\)|\(HEAVY corruption\)|\(moderate corruption\)|\(removed [0-9]+ sprites\)).*")
 map_ext_pattern = re.compile("\\.map$", re.IGNORECASE)
@@ -49,22 +119,747 @@ tile_end = "Tile search finished."
 sound_start = "Searching for sounds used in current map..."
 sound_end = "Sound search finished."
 
+# Indicates that all searches of the current map are done
+search_end = "Search finished."
+
+# Byte-level search pattern for the map load line and the start of the tile and sound searches.
+# Used to scan the memory-mapped log without decoding it.
+log_marker_pattern = re.compile(rb"^[ \t]*(?:Loaded V[0-9]+ map (.*) (successfully|\(EXTREME corruption\)|\(HEAVY corruption\)|\(moderate corruption\)|\(removed [0-9]+ sprites\))"
+                                + b"|(" + re.escape(tile_start.encode()) + b")|(" + re.escape(sound_start.encode()) + b"))", re.MULTILINE)
+
+# dtype of all tile and sound counters
+COUNT_DTYPE = np.uint32
+
+# Categories of tile usage, in the order in which dump_used_assets.m32 reports them
+tile_categories = ("sprite", "floor", "ceiling", "wall", "overwall")
+
+# Lookup tables from the first character of a verbose tile line to its category code, and the length of its name
+_tile_code_lookup = np.full(256, -1, dtype=np.int64)
+_tile_code_lookup[[ord(cat[0]) for cat in tile_categories]] = np.arange(len(tile_categories))
+_tile_name_lengths = np.array([len(cat) for cat in tile_categories])
+# the full category name and the comma that follows it, which each line must start with
+_tile_name_prefixes = [np.frombuffer(f"{cat},".encode("ascii"), dtype=np.uint8) for cat in tile_categories]
+
+# Sound emitter types, in the order of quotes 21-28 of dump_used_assets.m32.
+# Emitters not in this list are assigned overflow codes, starting at len(sound_emitters).
+sound_emitters = ("MUSICANDSFX triggered", "MUSICANDSFX ambient", "sector one-time", "MIKE",
+                  "switch", "MIRROR", "sector 65534", "doortile")
+_sound_emitter_codes = {e: i for i, e in enumerate(sound_emitters)}
+
+class LogMapIndex(NamedTuple):
+    """ Location of the statistics of a single map load inside the log, as (start, end) byte offsets. """
+    mapname: str
+    status: str
+    tile_blocks: List[Tuple[int, int]]
+    sound_blocks: List[Tuple[int, int]]
+    offset: int     # start of the map load line
+
+
+class SoundCounts(NamedTuple):
+    """ Sound counts of a single map, with one row per emitter type that occurs in the map, in emitter code order. """
+    emitters: Tuple[str, ...]
+    counts: np.ndarray      # shape (len(emitters), highest sound index of the map + 1)
+
+
+class MapResult:
+    """
+    Statistics of a single map, as yielded by MapStatsParser.iter_log once the searches of the map are finished.
+    Holds only the counts of the map, not its log lines.
+    """
+    __slots__ = ("path", "status", "tile_stats", "sound_counts", "tile_rejects", "sound_rejects")
+
+    def __init__(self, path: str, status: str, tile_stats: "SparseStats", sound_counts: SoundCounts,
+                 tile_rejects: List[str], sound_rejects: List[str]):
+        self.path = path                    # map path as reported by mapster32
+        self.status = status                # "successfully", "(HEAVY corruption)", "(removed 3 sprites)" etc.
+        self.tile_stats = tile_stats        # counts per tile category
+        self.sound_counts = sound_counts    # counts per sound emitter
+        self.tile_rejects = tile_rejects    # tile lines with out of range picnums
+        self.sound_rejects = sound_rejects  # sound lines with out of range sound numbers
+
+    @property
+    def corrupted(self) -> bool:
+        return self.status.endswith("corruption)")
+
+    @property
+    def removed_sprites(self) -> int:
+        """ Number of sprites mapster32 removed while loading the map. """
+        match = re.match(r"\(removed ([0-9]+) sprites\)", self.status)
+        return int(match.group(1)) if match else 0
+
+    def __repr__(self) -> str:
+        return (f"MapResult({self.path!r}, {self.status!r}, tiles={len(self.tile_stats.indices)}, "
+                f"sounds={int(self.sound_counts.counts.sum())}, rejects={len(self.tile_rejects) + len(self.sound_rejects)})")
+
+
+@contextlib.contextmanager
+def log_view(buf) -> Iterator[memoryview]:
+    """
+    Memoryview of a log buffer, e.g. an mmap, which is released when the block is left.
+    Slices of the view and arrays over them must not outlive the block, as releasing the view would then
+    raise a BufferError. This includes the local variables of frames kept alive by an exception's traceback.
+    """
+    view = memoryview(buf)
+    try:
+        yield view
+    finally:
+        view.release()
+
+
+def decode_log_text(text: bytes) -> str:
+    """ Decodes text from the log as UTF-8, falling back to latin-1 for stray non-UTF-8 bytes in map paths. """
+    try:
+        return text.decode("utf8")
+    except UnicodeDecodeError:
+        return text.decode("latin-1")
+
+
+def narrow_counts(counts: np.ndarray) -> np.ndarray:
+    """ Converts summed up counts to COUNT_DTYPE. Should they exceed its range, they are kept as uint64 instead. """
+    if counts.size > 0 and counts.max() > np.iinfo(COUNT_DTYPE).max:
+        print(f"WARNING: Total count {counts.max()} exceeds the range of {np.dtype(COUNT_DTYPE).name}, using uint64", file=sys.stderr)
+        return counts.astype(np.uint64)
+    return counts.astype(COUNT_DTYPE)
+
+
+class SparseStats:
+    """
+    Sparse statistics of a single map, or of the total over all maps.
+    Only the sorted unique indices that are used at least once are stored, together with a compact
+    count matrix that holds one row per column (e.g. per tile category) and one entry per used index.
+    For compatibility, it can be used like a read-only dict of columns. Accessing a column
+    builds a dense array of `size` entries, which is not kept.
+    """
+    __slots__ = ("columns", "indices", "counts", "size")
+
+    def __init__(self, columns: Tuple[str, ...], indices: np.ndarray, counts: np.ndarray, size: int):
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self.indices: np.ndarray = indices
+        self.counts: np.ndarray = counts
+        self.size: int = size
+
+    @classmethod
+    def from_histogram(cls, columns: Tuple[str, ...], hist: np.ndarray) -> "SparseStats":
+        """ Builds the sparse statistics from a dense matrix with one row per column. """
+        used = np.flatnonzero(hist.any(axis=0))
+        return cls(columns, used.astype(np.int32), narrow_counts(hist[:, used]), hist.shape[1])
+
+    @classmethod
+    def from_dense(cls, stats: Dict[str, np.ndarray]) -> "SparseStats":
+        """ Builds the sparse statistics from a dict of dense columns of equal length. """
+        return cls.from_histogram(tuple(stats.keys()), np.vstack([np.asarray(v) for v in stats.values()]))
+
+    @staticmethod
+    def sum(stats: List["SparseStats"]) -> "SparseStats":
+        """
+        Sums up the given statistics, e.g. to get the total over all maps.
+        The columns of the result are the union of the columns, in order of appearance.
+        """
+        columns = []
+        for st in stats:
+            columns += [c for c in st.columns if c not in columns]
+        indices, inverse = np.unique(np.concatenate([st.indices for st in stats] + [np.zeros(0, dtype=np.int32)]), return_inverse=True)
+        counts = np.zeros((len(columns), len(indices)), dtype=np.uint64)
+        offset = 0
+        for st in stats:
+            rows = [columns.index(c) for c in st.columns]
+            counts[np.ix_(rows, inverse[offset:offset + len(st.indices)])] += st.counts
+            offset += len(st.indices)
+        size = max([st.size for st in stats], default=0)
+        return SparseStats(tuple(columns), indices.astype(np.int32), narrow_counts(counts), size)
+
+    def nonzero(self, col: str) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns the indices with a nonzero count in the given column, and their counts. """
+        row = self.counts[self.columns.index(col)]
+        mask = row != 0
+        return self.indices[mask], row[mask]
+
+    def dense(self) -> np.ndarray:
+        """ Returns a dense matrix of shape (len(columns), size). """
+        mat = np.zeros((len(self.columns), self.size), dtype=self.counts.dtype)
+        mat[:, self.indices] = self.counts
+        return mat
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        if col not in self.columns:
+            raise KeyError(col)
+        arr = np.zeros(self.size, dtype=self.counts.dtype)
+        arr[self.indices] = self.counts[self.columns.index(col)]
+        return arr
+
+    def __contains__(self, col) -> bool:
+        return col in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def keys(self):
+        return list(self.columns)
+
+    def values(self):
+        return [self[c] for c in self.columns]
+
+    def items(self):
+        return [(c, self[c]) for c in self.columns]
+
+
+def split_sql_script(script: str) -> List[str]:
+    """ Splits an SQL script into its individual statements. """
+    statements = []
+    current = ""
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    if current.strip() != "":
+        statements.append(current.strip())
+    return statements
+
+
+def load_stats_npz(path: str) -> Dict[str, np.ndarray]:
+    """
+    Opens the statistics written by MapStatsParser.export_stats_to_npz, memory-mapping each array of the archive.
+    Only the array headers are read, slicing e.g. `stats["tiles"][map_index]` reads just the data of that map.
+    :param path: npz file written by export_stats_to_npz
+    :return: dict of read-only arrays, see export_stats_to_npz for the contents
+    """
+    arrays = dict()
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as fd:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Array '{info.filename}' of '{path}' is compressed and cannot be memory-mapped")
+            # skip the local file header, whose extra field may differ from the central directory
+            fd.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", fd.read(4))
+            fd.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(fd)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fd)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fd)
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if dtype.hasobject:
+                raise ValueError(f"Array '{name}' of '{path}' contains objects and cannot be memory-mapped")
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=fd.tell(), shape=shape,
+                                         order="F" if fortran_order else "C")
+    return arrays
+
+
+def fit_length(arr: np.ndarray, length: int) -> np.ndarray:
+    """ Returns the array truncated or zero-padded to the given length, without modifying it. """
+    if len(arr) >= length:
+        return arr[:length]
+    padded = np.zeros(length, dtype=arr.dtype)
+    padded[:len(arr)] = arr
+    return padded
+
+
+def count_log_lines(logpath: str) -> int:
+    """ Counts the lines of the log file, without decoding it. """
+    with open(logpath, "rb") as fd:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: fd.read(1 << 20), b""))
+
+
+def reset_peak_rss() -> bool:
+    """ Resets the peak resident set size of this process. Only supported on Linux, returns False otherwise. """
+    try:
+        with open("/proc/self/clear_refs", "w") as fd:
+            fd.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> Optional[float]:
+    """ Returns the peak resident set size of this process in MiB, or None if it cannot be determined. """
+    try:
+        with open("/proc/self/status", "r") as fd:
+            for line in fd:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+class OutOfCoreView(Mapping):
+    """ Read-only mapping of map names to the statistics of each map, which are read from disk on access. """
+
+    def __init__(self, keys: List[str], getter: Callable[[str], Dict[str, np.ndarray]]):
+        self._keys = keys
+        self._key_set = set(keys)
+        self._getter = getter
+
+    def __getitem__(self, mapname: str) -> Dict[str, np.ndarray]:
+        if mapname not in self._key_set:
+            raise KeyError(mapname)
+        return self._getter(mapname)
+
+    def __contains__(self, mapname) -> bool:
+        return mapname in self._key_set
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class OutOfCoreStats:
+    """
+    Disk-backed statistics of all maps, for logs with more maps than fit into memory.
+    The tile counts of each map are written into a (maps, categories + total, maxtiles) memmap tensor,
+    stored as `tiles.npy` in the given directory. The sound counts of each map are appended to `sounds.dat`.
+    The totals over all maps are accumulated as running sums, hence memory usage does not depend on the number of maps.
+    Mapped pages are periodically flushed and released, to keep the resident set size flat.
+    """
+    # number of map rows written or read between releasing the mapped pages
+    release_interval = 256
+
+    def __init__(self, directory: str, mapnames: List[str], maxtiles: int, maxsounds: int = 16384):
+        os.makedirs(directory, exist_ok=True)
+        self.mapnames = mapnames
+        self.map_rows = {m: i for i, m in enumerate(mapnames)}
+        self.tile_columns = tile_categories + ("total",)
+        shape = (len(mapnames), len(self.tile_columns), maxtiles)
+        if len(mapnames) > 0:
+            self.tiles = np.lib.format.open_memmap(os.path.join(directory, "tiles.npy"), mode="w+", dtype=COUNT_DTYPE, shape=shape)
+        else:
+            self.tiles = np.zeros(shape, dtype=COUNT_DTYPE)
+        self.tile_total = np.zeros(shape[1:], dtype=np.uint64)
+        self.filled = np.zeros(len(mapnames), dtype=bool)
+
+        # per map: offset into sounds.dat, emitter codes and width of the SoundCounts matrix
+        self.sound_path = os.path.join(directory, "sounds.dat")
+        self.sound_file = open(self.sound_path, "w+b")
+        self.sounds: Optional[np.memmap] = None
+        self.sound_blocks: List[Optional[Tuple[int, Tuple[int, ...], int]]] = [None] * len(mapnames)
+        self.emitter_codes: Dict[str, int] = dict(_sound_emitter_codes)
+        self.emitter_maps = np.zeros(len(self.emitter_codes), dtype=np.int64)
+        self.sound_total = np.zeros((len(self.emitter_codes), maxsounds + 1), dtype=np.uint64)
+        self.sound_width = 1
+        self._accessed = 0
+
+    def add_map(self, mapname: str, tile_stats: "SparseStats", sound_counts: SoundCounts) -> None:
+        """ Writes the statistics of a map. If the map was already written, its previous statistics are replaced. """
+        i = self.map_rows[mapname]
+        if self.filled[i]:
+            self.tile_total -= self.tiles[i]
+            offset, codes, width = self.sound_blocks[i]
+            self.sound_total[list(codes), :width] -= self._read_sound_block(offset, len(codes), width)
+            self.emitter_maps[list(codes)] -= 1
+
+        row = tile_stats.dense()
+        self.tiles[i] = row
+        self.tile_total += row
+        self.filled[i] = True
+
+        codes = [self.emitter_codes.setdefault(e, len(self.emitter_codes)) for e in sound_counts.emitters]
+        if len(self.emitter_codes) > len(self.emitter_maps):
+            grow = len(self.emitter_codes) - len(self.emitter_maps)
+            self.emitter_maps = np.concatenate([self.emitter_maps, np.zeros(grow, dtype=np.int64)])
+            self.sound_total = np.vstack([self.sound_total, np.zeros((grow, self.sound_total.shape[1]), dtype=np.uint64)])
+        width = sound_counts.counts.shape[1]
+        offset = self.sound_file.seek(0, os.SEEK_END)
+        self.sound_file.write(sound_counts.counts.astype(COUNT_DTYPE).tobytes())
+        self.sound_blocks[i] = (offset, tuple(codes), width)
+        self.sound_total[codes, :width] += sound_counts.counts
+        self.emitter_maps[codes] += 1
+        self.sound_width = max(self.sound_width, width)
+        self._accessed_row()
+
+    def finish(self) -> None:
+        """ Flushes all writes, and maps the sound counts for reading. """
+        if isinstance(self.tiles, np.memmap):
+            self.tiles.flush()
+        self.sound_file.flush()
+        if self.sound_file.tell() > 0:
+            self.sounds = np.memmap(self.sound_path, dtype=COUNT_DTYPE, mode="r")
+
+    def _read_sound_block(self, offset: int, nemitters: int, width: int) -> np.ndarray:
+        count = nemitters * width
+        if self.sounds is not None:
+            return self.sounds[offset // 4: offset // 4 + count].reshape(nemitters, width)
+        self.sound_file.seek(offset)
+        return np.fromfile(self.sound_file, dtype=COUNT_DTYPE, count=count).reshape(nemitters, width)
+
+    def _accessed_row(self) -> None:
+        """ Flushes and releases the mapped pages every release_interval rows. """
+        self._accessed += 1
+        if self._accessed % self.release_interval != 0:
+            return
+        for mm in (self.tiles, self.sounds):
+            if isinstance(mm, np.memmap):
+                mm.flush()
+                raw = getattr(mm, "_mmap", None)
+                if raw is not None and hasattr(mmap, "MADV_DONTNEED"):
+                    raw.madvise(mmap.MADV_DONTNEED)
+
+    def _tile_row(self, mapname: str) -> Dict[str, np.ndarray]:
+        if mapname == "total":
+            total = narrow_counts(self.tile_total)
+            return {col: total[c] for c, col in enumerate(self.tile_columns)}
+        i = self.map_rows[mapname]
+        self._accessed_row()
+        return {col: self.tiles[i, c] for c, col in enumerate(self.tile_columns)}
+
+    def _sound_row(self, mapname: str) -> Dict[str, np.ndarray]:
+        names = list(self.emitter_codes)
+        if mapname == "total":
+            total = narrow_counts(self.sound_total[:, :self.sound_width])
+            stats = {names[c]: total[c] for c in np.flatnonzero(self.emitter_maps > 0)}
+            stats["total"] = narrow_counts(self.sound_total[:, :self.sound_width].sum(axis=0, dtype=np.uint64))
+            return stats
+        offset, codes, width = self.sound_blocks[self.map_rows[mapname]]
+        block = self._read_sound_block(offset, len(codes), width)
+        self._accessed_row()
+        stats = {names[c]: block[j] for j, c in enumerate(codes)}
+        stats["total"] = block.sum(axis=0, dtype=COUNT_DTYPE)
+        return stats
+
+    def tile_stats(self) -> OutOfCoreView:
+        """ Returns the tile statistics in the format of aggregate_tilestats, read from disk on access. """
+        keys = self.mapnames + ["total"] if len(self.mapnames) > 1 else list(self.mapnames)
+        return OutOfCoreView(keys, self._tile_row)
+
+    def sound_stats(self) -> OutOfCoreView:
+        """ Returns the sound statistics in the format of aggregate_soundstats, read from disk on access. """
+        keys = self.mapnames + ["total"] if len(self.mapnames) > 1 else list(self.mapnames)
+        return OutOfCoreView(keys, self._sound_row)
+
+
+class PhaseProfiler:
+    """
+    Records the duration of named phases, along with the peak RSS and the number of lines and maps they processed.
+    Phases with the same name are accumulated. Phases entered within another phase are recorded as `outer/inner`,
+    the peak RSS and allocations are only measured for the outermost phases.
+    Optionally, tracemalloc is used to record the peak traced memory and the top allocation sites of each phase.
+    Memory allocated by worker processes (--jobs) is not included.
+    """
+
+    def __init__(self, trace_allocations: bool = False, top_allocations: int = 10):
+        self.trace_allocations = trace_allocations
+        self.top_allocations = top_allocations
+        self.phases: Dict[str, dict] = dict()
+        self.info: Dict[str, object] = dict()
+        self._stack: List[str] = []
+        self._start = time.perf_counter()
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[dict]:
+        """ Times the enclosed block. The yielded dict may be assigned "lines" and "maps" counts. """
+        full_name = "/".join(self._stack + [name])
+        outermost = len(self._stack) == 0
+        record = self.phases.setdefault(full_name, {"phase": full_name, "seconds": 0.0, "calls": 0})
+        counts = dict()
+        rss_reset = False
+        if outermost:
+            rss_reset = reset_peak_rss()
+            if self.trace_allocations:
+                tracemalloc.reset_peak()
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            record["seconds"] += seconds
+            record["calls"] += 1
+            for k in ("lines", "maps"):
+                if k in counts:
+                    record[k] = record.get(k, 0) + counts[k]
+            if outermost:
+                peak = peak_rss_mb()
+                record["peak_rss_mb"] = peak if rss_reset or "peak_rss_mb" not in record else max(peak, record["peak_rss_mb"])
+                if self.trace_allocations:
+                    record["traced_peak_mb"] = max(tracemalloc.get_traced_memory()[1] / (1024 * 1024),
+                                                   record.get("traced_peak_mb", 0.0))
+                    record["top_allocations"] = self._top_allocations()
+
+    def _top_allocations(self) -> List[dict]:
+        """ Returns the allocation sites that hold the most memory at this point. """
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        return [{"location": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                 "size_kb": s.size / 1024, "count": s.count}
+                for s in snapshot.statistics("lineno")[:self.top_allocations]]
+
+    def report(self) -> dict:
+        """ Returns the recorded phases and info as a JSON-serializable dict. """
+        phases = []
+        for record in self.phases.values():
+            record = dict(record)
+            for k in ("lines", "maps"):
+                if k in record and record["seconds"] > 0:
+                    record[f"{k}_per_s"] = record[k] / record["seconds"]
+            phases.append(record)
+        return {"version": __version__, **self.info, "total_seconds": time.perf_counter() - self._start,
+                "peak_rss_mb": peak_rss_mb(), "phases": phases}
+
+    def write_report(self, path: str) -> None:
+        with open(path, "w") as fd:
+            json.dump(self.report(), fd, indent=2)
+
+
+def follow_log_lines(logpath: str, poll_interval: float = 1.0, on_idle: Optional[Callable[[], None]] = None) -> Iterator[str]:
+    """
+    Yields the lines of the log from its beginning, and then the lines appended to it, like `tail -F`.
+    Once the end of the file is reached, on_idle is called, and the file is checked every poll_interval seconds.
+    If the file is truncated, reading restarts at its beginning. If it is replaced, e.g. by log rotation,
+    the rest of the old file is read before switching to the new file.
+    Lines are only yielded once they are complete, and are decoded with decode_log_text.
+    """
+    fd = None
+    partial = b""
+    idle, replaced = False, False
+    try:
+        while True:
+            if fd is None:
+                try:
+                    fd = open(logpath, "rb")
+                except FileNotFoundError:
+                    time.sleep(poll_interval)
+                    continue
+                partial = b""
+                replaced = False
+
+            chunk = fd.read(1 << 16)
+            if chunk:
+                idle = False
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                for line in lines:
+                    yield decode_log_text(line) + "\n"
+                continue
+
+            if replaced:
+                fd.close()
+                fd = None
+                continue
+            if not idle:
+                idle = True
+                if on_idle is not None:
+                    on_idle()
+            time.sleep(poll_interval)
+
+            try:
+                st = os.stat(logpath)
+            except FileNotFoundError:
+                # rotated, but the new file has not been created yet
+                continue
+            if st.st_ino != os.fstat(fd.fileno()).st_ino or st.st_dev != os.fstat(fd.fileno()).st_dev:
+                replaced = True
+            elif st.st_size < fd.tell():
+                print(f"{logpath} was truncated, reading from its beginning")
+                fd.seek(0)
+                partial = b""
+    finally:
+        if fd is not None:
+            fd.close()
+
+
+class RunningTotals:
+    """
+    Totals over all maps, updated whenever a map is added or replaced, as used by --follow.
+    The totals are kept as dense uint64 matrices, such that updates do not depend on the number of maps.
+    """
+    __slots__ = ("maxtiles", "maxsounds", "tile_stats", "sound_counts", "tiles", "sounds", "emitter_maps")
+
+    def __init__(self, maxtiles: int, maxsounds: int = 16384):
+        self.maxtiles = maxtiles
+        self.maxsounds = maxsounds
+        self.tile_stats: Dict[str, SparseStats] = dict()
+        self.sound_counts: Dict[str, SoundCounts] = dict()
+        self.tiles = np.zeros((len(tile_categories) + 1, maxtiles), dtype=np.uint64)
+        # sound number maxsounds is still valid, see _count_sounds
+        self.sounds: Dict[str, np.ndarray] = {e: np.zeros(maxsounds + 1, dtype=np.uint64) for e in sound_emitters}
+        self.emitter_maps: Dict[str, int] = {e: 0 for e in sound_emitters}
+
+    def __len__(self) -> int:
+        return len(self.tile_stats)
+
+    def update(self, result: MapResult) -> None:
+        """ Adds the counts of the map, replacing its previous counts if it was added before. """
+        self._apply(result.path, -1)
+        self.tile_stats[result.path] = result.tile_stats
+        self.sound_counts[result.path] = result.sound_counts
+        self._apply(result.path, 1)
+
+    def _apply(self, path: str, sign: int) -> None:
+        if path not in self.tile_stats:
+            return
+        st = self.tile_stats[path]
+        rows = [(tile_categories + ("total",)).index(c) for c in st.columns]
+        if sign > 0:
+            self.tiles[np.ix_(rows, st.indices)] += st.counts
+        else:
+            self.tiles[np.ix_(rows, st.indices)] -= st.counts
+        sc = self.sound_counts[path]
+        for e, row in zip(sc.emitters, sc.counts):
+            if e not in self.sounds:
+                self.sounds[e] = np.zeros(self.maxsounds + 1, dtype=np.uint64)
+                self.emitter_maps[e] = 0
+            if sign > 0:
+                self.sounds[e][:len(row)] += row
+            else:
+                self.sounds[e][:len(row)] -= row
+            self.emitter_maps[e] += sign
+
+    def tile_total(self) -> SparseStats:
+        """ Returns the tile totals over all maps, as aggregate_tilestats stores them under "total". """
+        return SparseStats.from_histogram(tile_categories + ("total",), self.tiles)
+
+    def sound_total(self) -> Dict[str, np.ndarray]:
+        """ Returns the sound totals over all maps, as aggregate_soundstats stores them under "total". """
+        width = max(sc.counts.shape[1] for sc in self.sound_counts.values())
+        total = {e: narrow_counts(v[:width]) for e, v in self.sounds.items() if self.emitter_maps[e] > 0}
+        total["total"] = narrow_counts(sum((v[:width] for e, v in self.sounds.items()), np.zeros(width, dtype=np.uint64)))
+        return total
+
+
+class AssetIndex:
+    """
+    Inverted index from tile and sound numbers to the maps that use them, with the count per category or emitter.
+    It is stored as an uncompressed npz archive, such that lookups only read the entries of the requested numbers.
+    For each kind ("tile" and "sound"), the entries are sorted by number, then by map and column:
+        maps:               map names, the total over all maps is not included
+        <kind>_columns:     tile categories or sound emitters
+        <kind>_indptr:      the entries of number n are at positions indptr[n] to indptr[n + 1]
+        <kind>_map:         map index of each entry
+        <kind>_column:      column index of each entry
+        <kind>_count:       nonzero count of each entry
+    """
+    kinds = ("tile", "sound")
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+
+    @classmethod
+    def build(cls, tile_stats: Dict, sound_stats: Dict, maxtiles: int, maxsounds: int = 16384) -> "AssetIndex":
+        """
+        Builds the index from the statistics of all maps, as returned by the aggregation and parse functions.
+        The index covers all valid tile and sound numbers, including those that no map uses.
+        :param tile_stats: Dictionary containing the collected tile statistics
+        :param sound_stats: Dictionary containing the collected sound statistics
+        :param maxtiles: Number of tiles
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        """
+        mapnames = [k for k in tile_stats.keys() if k != "total"]
+        arrays = {"maps": np.array(mapnames, dtype=str)}
+        for kind, stat_dict, codes in (("tile", tile_stats, {c: i for i, c in enumerate(tile_categories)}),
+                                       ("sound", sound_stats, dict(_sound_emitter_codes))):
+            numbers, map_ids, columns, counts = [np.zeros(0, dtype=np.int64)], [], [], [np.zeros(0, dtype=COUNT_DTYPE)]
+            # sound number maxsounds is still valid, see _count_sounds
+            size = maxtiles if kind == "tile" else maxsounds + 1
+            for m, k in enumerate(mapnames):
+                stats = stat_dict[k]
+                for col in stats.keys():
+                    if col == "total":
+                        continue
+                    if isinstance(stats, SparseStats):
+                        nz, cnt = stats.nonzero(col)
+                    else:
+                        arr = np.asarray(stats[col])
+                        nz = np.flatnonzero(arr)
+                        cnt = arr[nz]
+                        size = max(size, len(arr))
+                    numbers.append(nz.astype(np.int64))
+                    counts.append(cnt)
+                    map_ids.append(np.full(len(nz), m, dtype=np.uint32))
+                    columns.append(np.full(len(nz), codes.setdefault(col, len(codes)), dtype=np.uint8))
+
+            numbers = np.concatenate(numbers)
+            map_ids = np.concatenate(map_ids + [np.zeros(0, dtype=np.uint32)])
+            columns = np.concatenate(columns + [np.zeros(0, dtype=np.uint8)])
+            order = np.lexsort((columns, map_ids, numbers))
+            arrays[f"{kind}_columns"] = np.array(list(codes), dtype=str)
+            arrays[f"{kind}_indptr"] = np.concatenate(([0], np.cumsum(np.bincount(numbers, minlength=size)))).astype(np.int64)
+            arrays[f"{kind}_map"] = map_ids[order]
+            arrays[f"{kind}_column"] = columns[order]
+            arrays[f"{kind}_count"] = narrow_counts(np.concatenate(counts).astype(np.uint64)[order])
+        return cls(arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "AssetIndex":
+        """ Opens an index written by save, memory-mapping its arrays. """
+        return cls(load_stats_npz(path))
+
+    def save(self, path: str) -> None:
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for name, arr in self.arrays.items():
+                MapStatsParser._npz_write_array(zf, name, arr)
+
+    def size(self, kind: str) -> int:
+        """ Returns the number of tiles or sounds covered by the index. """
+        return len(self.arrays[f"{kind}_indptr"]) - 1
+
+    def lookup(self, kind: str, first: int, last: Optional[int] = None) -> List[Tuple[int, str, str, int]]:
+        """
+        Looks up the maps that use the given tile or sound numbers.
+        :param kind: "tile" or "sound"
+        :param first: first number to look up
+        :param last: last number to look up, inclusive. Defaults to first.
+        :return: List of (number, map, category or emitter, count), sorted by number, map and column
+        """
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown index kind '{kind}', expected one of {', '.join(self.kinds)}")
+        last = first if last is None else last
+        indptr = self.arrays[f"{kind}_indptr"]
+        first, last = max(first, 0), min(last, len(indptr) - 2)
+        if first > last:
+            return []
+        start, end = int(indptr[first]), int(indptr[last + 1])
+        numbers = np.searchsorted(indptr[first:last + 2], np.arange(start, end), side="right") - 1 + first
+        mapnames = self.arrays["maps"]
+        colnames = self.arrays[f"{kind}_columns"]
+        return [(n, str(mapnames[m]), str(colnames[c]), cnt) for n, m, c, cnt in
+                zip(numbers.tolist(), self.arrays[f"{kind}_map"][start:end].tolist(),
+                    self.arrays[f"{kind}_column"][start:end].tolist(), self.arrays[f"{kind}_count"][start:end].tolist())]
+
+
 class MapStatsParser:
     def __init__(self, maxtiles, **kwargs):
         self.stats_db: Optional[sqlite3.Connection] = None
+        self.schema_cache: Dict[str, List[str]] = dict()
+        self.profiler: Optional[PhaseProfiler] = None
         self.maxtiles = maxtiles
 
-        # expected: paths to pickle files
-        self.extra_tilestats: Dict[str, np.ndarray] = dict()
-        for k, v in kwargs.items(): ## path to additional files
-            print(f"Using extra stats file: {v}")
-            with open(v, 'rb') as fd:
-                loaded_arr = pickle.load(fd)
-                if type(loaded_arr) != np.ndarray:
-                    raise ValueError(f"Extra stats file '{v}' does not contain a valid ndarray!")
-                elif loaded_arr.shape != (maxtiles,):
-                    raise ValueError(f"Size of extra stats array '{v}' is '{loaded_arr.shape}', but maxtiles specified as '{maxtiles}'!")
-                self.extra_tilestats[k] = loaded_arr
+        # expected: paths to indicator store files, or legacy pickle files. Arrays are decoded on first use.
+        self.extra_tilestats = IndicatorStore(kwargs, maxtiles)
+
+
+    def enable_profiling(self, trace_allocations: bool = False, top_allocations: int = 10) -> PhaseProfiler:
+        """ Starts recording the phases entered with profile_phase, including those within the exporters. """
+        self.profiler = PhaseProfiler(trace_allocations, top_allocations)
+        return self.profiler
+
+
+    def profile_phase(self, name: str):
+        """ Context manager that times the enclosed block as a phase, if profiling is enabled.
+            Yields a dict that may be assigned "lines" and "maps" counts. """
+        if self.profiler is None:
+            return contextlib.nullcontext(dict())
+        return self.profiler.phase(name)
+
+
+    def profile_report(self) -> Optional[dict]:
+        """ Returns the profiling report, or None if profiling is not enabled. """
+        return self.profiler.report() if self.profiler is not None else None
 
 
     @staticmethod
@@ -104,6 +899,717 @@ class MapStatsParser:
         return tiles_per_map, sounds_per_map
 
 
+    @staticmethod
+    def parse_log_streaming(logpath: str, maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True):
+        """
+        Parse the mapster32.log and count the tiles and sounds in a single pass, see iter_log.
+        Unlike parse_log, the lines of the log are not stored, only the counts for each map.
+        Hence memory usage depends on the number of maps and maxtiles, but not on the size of the log.
+        The results are identical to the output of parse_log followed by aggregate_tilestats and aggregate_soundstats.
+        :param logpath: log file from which to read the dump
+        :param maxtiles: Maximum expected tilenum, see aggregate_tilestats.
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :return: Tuple: (tile_stats, tile_rejects, sound_stats, sound_rejects)
+        """
+        tile_stats: Dict[str, SparseStats] = dict()
+        tile_rejects: Dict[str, List[str]] = dict()
+        sound_counts: Dict[str, SoundCounts] = dict()
+        sound_rejects: Dict[str, List[str]] = dict()
+
+        for result in MapStatsParser.iter_log(logpath, maxtiles, maxsounds, skip_overwall0):
+            tile_stats[result.path] = result.tile_stats
+            tile_rejects[result.path] = result.tile_rejects
+            sound_counts[result.path] = result.sound_counts
+            sound_rejects[result.path] = result.sound_rejects
+        print("Statistics parsed from log file")
+
+        MapStatsParser._add_tilestats_total(tile_stats, maxtiles)
+        return tile_stats, tile_rejects, MapStatsParser._soundstats_to_arrays(sound_counts), sound_rejects
+
+
+    @staticmethod
+    def iter_log(logpath: str, maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True) -> Iterator[MapResult]:
+        """
+        Reads the mapster32.log and yields the statistics of each map as soon as its searches are finished,
+        such that only the counts of a single map are held in memory at a time. See iter_map_results.
+        :param logpath: log file from which to read the dump
+        :param maxtiles: Maximum expected tilenum, see aggregate_tilestats.
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :return: Iterator of MapResult, in the order of the log
+        """
+        with open(logpath, 'r', encoding="utf8") as fd:
+            yield from MapStatsParser.iter_map_results(fd, maxtiles, maxsounds, skip_overwall0)
+
+
+    @staticmethod
+    def iter_map_results(lines: Iterable[str], maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True) -> Iterator[MapResult]:
+        """
+        Counts the tiles and sounds of each map in the given log lines, and yields the result of a map once its
+        `Search finished.` line is read. Maps without that line, e.g. if the search was interrupted, are yielded
+        when the next map is loaded, or at the end of the lines. Searches that follow the `Search finished.` line
+        of a map without a new map load are added to the counts of the map, which is then yielded again with the
+        counts of all its searches. Hence the last result of each path holds the same counts as parse_log.
+        :param lines: lines of a mapster32.log, such as an open log file
+        :param maxtiles: Maximum expected tilenum, see aggregate_tilestats.
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :return: Iterator of MapResult, in the order of the lines
+        """
+        # counts of the map that is currently being read, converted to arrays once its searches are finished.
+        # sound lines are few, hence they are kept until then, and counted at most once.
+        curr_map, curr_status = None, None
+        curr_tiles: Optional[Dict[str, Dict[int, int]]] = None
+        curr_sounds: List[str] = []
+        curr_rejects: List[str] = []
+        # sound counts of the searches of the current map that were already yielded, and whether new lines were read since
+        prev_sounds: Optional[SoundCounts] = None
+        prev_sound_rejects: List[str] = []
+        pending = False
+
+        def finish_map() -> MapResult:
+            nonlocal curr_sounds, prev_sounds, prev_sound_rejects
+            codes = np.concatenate([np.full(len(curr_tiles[cat]), i) for i, cat in enumerate(tile_categories)])
+            tidx = np.concatenate([list(curr_tiles[cat].keys()) for cat in tile_categories]).astype(np.int64)
+            weights = np.concatenate([list(curr_tiles[cat].values()) for cat in tile_categories])
+            tile_stats = MapStatsParser._count_tiles(codes, tidx, maxtiles, skip_overwall0, weights)
+            sound_counts, sound_rejects = MapStatsParser._count_sounds(curr_map, curr_sounds, maxsounds)
+            if prev_sounds is not None:
+                sound_counts = MapStatsParser._sum_sound_counts([prev_sounds, sound_counts])
+            prev_sounds, prev_sound_rejects, curr_sounds = sound_counts, prev_sound_rejects + sound_rejects, []
+            return MapResult(curr_map, curr_status, tile_stats, sound_counts, list(curr_rejects), prev_sound_rejects)
+
+        in_block = None
+        for line in lines:
+            if in_block is None:
+                line = line.strip()
+                match = mapload_pattern.match(line)
+                if match:
+                    if pending:
+                        yield finish_map()
+                    curr_map, curr_status = match.group(1), match.group(2)
+                    curr_tiles = {cat: dict() for cat in tile_categories}
+                    curr_sounds, curr_rejects = [], []
+                    prev_sounds, prev_sound_rejects = None, []
+                    pending = True
+                elif line.startswith(tile_start) or line.startswith(sound_start):
+                    if curr_map is None:
+                        raise ValueError(f"Statistics found in log file before any map was loaded::{line}")
+                    pending = True
+                    in_block = tile_end if line.startswith(tile_start) else sound_end
+                elif line.startswith(search_end) and pending:
+                    yield finish_map()
+                    pending = False
+            elif line.startswith(in_block):
+                in_block = None
+            elif in_block is tile_end:
+                line = line.strip()
+                k = line.split(sep=',')
+                tidx = int(k[1])
+                if tidx >= maxtiles:
+                    print(f"WARNING: Tile index {tidx} in map {curr_map} exceeds MAXTILES of {maxtiles}::{line}", file=sys.stderr)
+                    curr_rejects.append(line)
+                elif tidx < 0:
+                    print(f"WARNING: Negative picnum {tidx} found in map {curr_map}::{line}", file=sys.stderr)
+                    curr_rejects.append(line)
+                else:
+                    counts = curr_tiles[k[0]]
+                    counts[tidx] = counts.get(tidx, 0) + 1
+            else:
+                curr_sounds.append(line.strip())
+
+        if pending:
+            yield finish_map()
+
+
+    def follow_log(self, logpath: str, maxsounds: int = 16384, skip_overwall0: bool = True,
+                   poll_interval: float = 1.0, normalized: bool = False) -> Iterator[MapResult]:
+        """
+        Follows the mapster32.log while it is being written, see follow_log_lines, and updates the database
+        each time the searches of a map are finished. Only the tables of that map are rewritten.
+        The tables of the total over all maps are rewritten, and all changes committed, whenever the end of
+        the log is reached. Requires an open database connection, see start_database.
+        Runs until interrupted, the pending changes are committed when the iteration stops.
+        :param logpath: log file from which to read the dump
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :param poll_interval: Seconds between checks for new lines, once the end of the log is reached.
+        :param normalized: Write into the normalized schema, see export_to_normalized_sqlite.
+        :return: Iterator of the MapResult of each map, after its tables were updated
+        """
+        if self.stats_db is None:
+            raise RuntimeError("No database connection")
+        totals = RunningTotals(self.maxtiles, maxsounds)
+        pending = [False]
+
+        def flush():
+            if not pending[0]:
+                return
+            with self.profile_phase("totals"):
+                if not normalized and len(totals) > 1:
+                    self.export_tiles_to_sqlite({"total": totals.tile_total()})
+                    self.export_sounds_to_sqlite({"total": totals.sound_total()})
+                self.commit_database()
+            pending[0] = False
+
+        lines = follow_log_lines(logpath, poll_interval, on_idle=flush)
+        try:
+            for result in self.iter_map_results(lines, self.maxtiles, maxsounds, skip_overwall0):
+                with self.profile_phase("map update") as counts:
+                    totals.update(result)
+                    sounds = self._soundstats_to_arrays({result.path: result.sound_counts})
+                    if normalized:
+                        self.export_to_normalized_sqlite({result.path: result.tile_stats}, sounds)
+                    else:
+                        self.export_tiles_to_sqlite({result.path: result.tile_stats})
+                        self.export_sounds_to_sqlite(sounds)
+                    pending[0] = True
+                    counts.update(maps=1)
+                yield result
+        finally:
+            lines.close()
+            flush()
+
+
+    @staticmethod
+    def parse_map_files(paths: List[str], maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True,
+                        sound_rules: Optional[SoundRules] = None):
+        """
+        Reads the given MAP files and counts their tiles and sounds, with the same results as if the maps were loaded
+        in mapster32, searched with dump_used_assets.m32, and the log parsed with parse_log_streaming.
+        GRP and ZIP archives are read in place, and each map they contain is counted, see containers.py.
+        :param paths: paths of the MAP files, used as map names, or of archives containing maps
+        :param maxtiles: Maximum expected tilenum, see aggregate_tilestats.
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :param sound_rules: picnums of the sound rules. If None, no sounds are counted.
+        :return: Tuple: (tile_stats, tile_rejects, sound_stats, sound_rejects)
+        """
+        tile_stats: Dict[str, SparseStats] = dict()
+        tile_rejects: Dict[str, List[str]] = dict()
+        sound_counts: Dict[str, SoundCounts] = dict()
+        sound_rejects: Dict[str, List[str]] = dict()
+
+        for path, source in iter_map_sources(paths):
+            result = MapStatsParser.count_map(source, maxtiles, maxsounds, skip_overwall0, sound_rules, path=path)
+            tile_stats[result.path] = result.tile_stats
+            tile_rejects[result.path] = result.tile_rejects
+            sound_counts[result.path] = result.sound_counts
+            sound_rejects[result.path] = result.sound_rejects
+        print("Statistics read from map files")
+
+        MapStatsParser._add_tilestats_total(tile_stats, maxtiles)
+        return tile_stats, tile_rejects, MapStatsParser._soundstats_to_arrays(sound_counts), sound_rejects
+
+
+    @staticmethod
+    def parse_map_batch(paths: List[str], maxtiles: int, jobs: int = 1, chunksize: int = 16, maxsounds: int = 16384,
+                        skip_overwall0: bool = True, sound_rules: Optional[SoundRules] = None,
+                        cache: Optional[ResultCache] = None):
+        """
+        Batch version of parse_map_files for whole directory trees of maps. The paths are expanded with
+        containers.expand_map_paths, and the maps are split into chunks that are counted by worker processes.
+        Each worker returns the sparse statistics of its maps, which are merged in the order of the paths.
+        Maps that cannot be read, e.g. because they are truncated or of an unsupported version, are skipped
+        and reported in the returned failures, instead of aborting the run.
+        :param paths: paths of MAP files, archives and directories, or glob patterns
+        :param maxtiles: Maximum expected tilenum, see aggregate_tilestats.
+        :param jobs: Number of worker processes. With 1, the maps are counted in this process.
+        :param chunksize: Number of maps sent to a worker at once.
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :param sound_rules: picnums of the sound rules. If None, no sounds are counted.
+        :param cache: if given, maps whose contents were counted before are taken from the cache, and only the others
+                      are sent to the workers. Maps with the same contents are only counted once per run.
+        :return: Tuple: (tile_stats, tile_rejects, sound_stats, sound_rejects, failures),
+                 where failures maps the names of the maps that could not be read to the error
+        """
+        failures: Dict[str, str] = dict()
+        units: List[Tuple[str, Optional[str]]] = []
+        keys: List[Optional[bytes]] = []
+        settings = ("map", maxtiles, maxsounds, skip_overwall0, sound_rules)
+        for path in expand_map_paths(paths):
+            path_keys = []
+            try:
+                if is_container(path):
+                    with open_container(path) as container:
+                        path_units = [(path, member) for member in container.maps()]
+                        if cache is not None:
+                            path_keys = [ResultCache.key(settings, [container.read(member)]) for _, member in path_units]
+                else:
+                    path_units = [(path, None)]
+                    if cache is not None:
+                        with open(path, "rb") as fd:
+                            path_keys = [ResultCache.key(settings, [fd.read()])]
+            except Exception as ex:
+                failures[path] = f"{type(ex).__name__}: {ex}"
+                continue
+            units += path_units
+            keys += path_keys
+        results, pending = MapStatsParser._lookup_cached(keys, len(units), cache)
+
+        chunks = [[units[i] for i in pending[j:j + chunksize]] for j in range(0, len(pending), max(chunksize, 1))]
+        args = (chunks, itertools.repeat(maxtiles), itertools.repeat(maxsounds), itertools.repeat(skip_overwall0),
+                itertools.repeat(sound_rules))
+        with (ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else contextlib.nullcontext()) as executor:
+            chunk_results = executor.map(_count_map_chunk, *args) if executor is not None else map(_count_map_chunk, *args)
+            counted = (r[5] if r[5] is not None else r[1:5] for chunk in chunk_results for r in chunk)
+            MapStatsParser._store_counted(results, keys, pending, counted, cache)
+
+        tile_stats: Dict[str, SparseStats] = dict()
+        tile_rejects: Dict[str, List[str]] = dict()
+        sound_counts: Dict[str, SoundCounts] = dict()
+        sound_rejects: Dict[str, List[str]] = dict()
+        for (path, member), result in zip(units, results):
+            mapname = path if member is None else f"{path}/{member}"
+            if isinstance(result, str):
+                failures[mapname] = result
+                continue
+            tile_stats[mapname], tile_rejects[mapname], sound_counts[mapname], sound_rejects[mapname] = result
+        print(f"Statistics read from {len(tile_stats)} map files")
+        if cache is not None:
+            print(f"{len(units) - len(pending)} of them were not counted again, as their contents were cached or seen before")
+        for mapname, error in failures.items():
+            print(f"WARNING: Map '{mapname}' could not be read: {error}", file=sys.stderr)
+
+        MapStatsParser._add_tilestats_total(tile_stats, maxtiles)
+        return tile_stats, tile_rejects, MapStatsParser._soundstats_to_arrays(sound_counts), sound_rejects, failures
+
+
+    @staticmethod
+    def count_map(source, maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True,
+                  sound_rules: Optional[SoundRules] = None, path: Optional[str] = None) -> MapResult:
+        """
+        Reads a single MAP file with map_reader.read_map, and counts its tiles and sounds.
+        The sounds are found with the rules of dump_used_assets.m32, see sound_rules.py.
+        Out of range picnums and sound numbers are rejected with the same warnings and lines as for the verbose log.
+        :param source: path of the map file, or a bytes-like object with its contents
+        :param maxtiles: Maximum expected tilenum, see aggregate_tilestats.
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :param sound_rules: picnums of the sound rules. If None, the result contains no sound counts.
+        :param path: name of the map, defaults to the source path
+        :return: MapResult of the map
+        """
+        build_map = read_map(source, path)
+        codes, tidx = tile_picnums(build_map)
+
+        # the rejected entries are reported as the lines mapster32 would have written
+        rejected = (tidx < 0) | (tidx >= maxtiles)
+        lines = {i: f"{tile_categories[codes[i]]},{tidx[i]}," for i in np.flatnonzero(rejected).tolist()}
+        tile_rejects = MapStatsParser._report_tile_rejects(build_map.path, tidx, rejected, lines, maxtiles)
+
+        valid = ~rejected
+        tile_stats = MapStatsParser._count_tiles(codes[valid], tidx[valid], maxtiles, skip_overwall0)
+        if sound_rules is None:
+            return MapResult(build_map.path, build_map.status, tile_stats,
+                             SoundCounts((), np.zeros((0, 0), dtype=COUNT_DTYPE)), tile_rejects, [])
+
+        codes, sidx = sound_hits(build_map, sound_rules)
+        rejected = (sidx < 0) | (sidx > maxsounds)
+        sound_rejects = []
+        for i in np.flatnonzero(rejected).tolist():
+            line = f"{sound_emitters[codes[i]]},{sidx[i]},"
+            if sidx[i] < 0:
+                print(f"WARNING: Negative sound index {sidx[i]} found in map {build_map.path}::{line}", file=sys.stderr)
+            else:
+                print(f"WARNING: Sound index {sidx[i]} in map {build_map.path} exceeds maxsounds of {maxsounds}::{line}", file=sys.stderr)
+            sound_rejects.append(line)
+        sound_counts = MapStatsParser._sound_histogram(codes[~rejected], sidx[~rejected], ())
+        return MapResult(build_map.path, build_map.status, tile_stats, sound_counts, tile_rejects, sound_rejects)
+
+
+    @staticmethod
+    def scan_log(buf, start: int = 0) -> List[LogMapIndex]:
+        """
+        Scans the raw bytes of the mapster32.log for the map load lines and the start and end markers
+        of the tile and sound searches. Lines inside of the tile and sound blocks are skipped without being inspected.
+        :param buf: bytes-like object containing the log, such as an mmap of the log file
+        :param start: Offset from which to scan. Must be at the start of a line.
+        :return: List of map loads in the order in which they appear in the log, each of which
+                 stores the byte offsets of its tile and sound blocks.
+        """
+        index: List[LogMapIndex] = []
+        pos = start
+        while True:
+            match = log_marker_pattern.search(buf, pos)
+            if match is None:
+                break
+
+            if match.group(1) is not None:
+                index.append(LogMapIndex(decode_log_text(match.group(1)), decode_log_text(match.group(2)), [], [], match.start()))
+                pos = match.end()
+                continue
+
+            if len(index) == 0:
+                raise ValueError(f"Statistics found in log file before any map was loaded::{decode_log_text(match.group(0))}")
+            if match.group(3) is not None:
+                end_marker, blocks = tile_end, index[-1].tile_blocks
+            else:
+                end_marker, blocks = sound_end, index[-1].sound_blocks
+
+            # block starts on the line following the marker, and ends at the start of the end marker line
+            start = buf.find(b"\n", match.end())
+            start = len(buf) if start < 0 else start + 1
+            end = buf.find(b"\n" + end_marker.encode(), start - 1)
+            end = len(buf) if end < 0 else end + 1
+            blocks.append((start, end))
+            pos = end
+
+        return index
+
+
+    @staticmethod
+    def count_indexed_maps(buf, index: List[LogMapIndex], maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True,
+                           cache: Optional[ResultCache] = None):
+        """
+        Counts the tiles and sounds of each map in the index produced by scan_log.
+        The tile blocks are read directly from slices of the buffer, without copying or decoding them.
+        If a map is loaded multiple times, the last load determines its statistics, as in parse_log.
+        :param buf: bytes-like object containing the log, the same as was passed to scan_log
+        :param index: map index produced by scan_log
+        :param maxtiles: Maximum expected tilenum, see aggregate_tilestats.
+        :param maxsounds: Maximum sound index, see aggregate_soundstats.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :param cache: if given, maps whose blocks were counted before are taken from the cache, and new maps added to it
+        :return: Tuple: (tile_stats, tile_rejects, sound_stats, sound_rejects)
+        """
+        tile_stats: Dict[str, SparseStats] = dict()
+        tile_rejects: Dict[str, List[str]] = dict()
+        sound_counts: Dict[str, SoundCounts] = dict()
+        sound_rejects: Dict[str, List[str]] = dict()
+
+        with log_view(buf) as view:
+            for entry in index:
+                key = MapStatsParser._log_cache_key(view, entry, maxtiles, maxsounds, skip_overwall0) if cache is not None else None
+                result = MapStatsParser._cache_get(cache, key) if cache is not None else None
+                if result is None:
+                    result = MapStatsParser._count_indexed_map(view, entry, maxtiles, maxsounds, skip_overwall0)
+                    if cache is not None:
+                        cache.put(key, MapStatsParser._to_plain_record(result))
+                tile_stats[entry.mapname], tile_rejects[entry.mapname], sound_counts[entry.mapname], sound_rejects[entry.mapname] = result
+
+        MapStatsParser._add_tilestats_total(tile_stats, maxtiles)
+        return tile_stats, tile_rejects, MapStatsParser._soundstats_to_arrays(sound_counts), sound_rejects
+
+
+    @staticmethod
+    def _count_indexed_map(view: memoryview, entry: LogMapIndex, maxtiles: int, maxsounds: int, skip_overwall0: bool):
+        """
+        Counts the tiles and sounds of a single map load of the index.
+        :return: Tuple: (tile stats, tile rejects, sound counts per emitter, sound rejects)
+        """
+        all_codes, all_tidx = [], []
+        tile_rejects = []
+        for start, end in entry.tile_blocks:
+            codes, tidx = MapStatsParser._tile_block_to_arrays(view[start:end])
+            rejected = (tidx < 0) | (tidx >= maxtiles)
+            if rejected.any():
+                lines = [line.strip() for line in decode_log_text(bytes(view[start:end])).split("\n")]
+                tile_rejects += MapStatsParser._report_tile_rejects(entry.mapname, tidx, rejected, lines, maxtiles)
+            all_codes.append(codes[~rejected])
+            all_tidx.append(tidx[~rejected])
+
+        codes = np.concatenate(all_codes) if all_codes else np.zeros(0, dtype=np.int64)
+        tidx = np.concatenate(all_tidx) if all_tidx else np.zeros(0, dtype=np.int64)
+        tile_stats = MapStatsParser._count_tiles(codes, tidx, maxtiles, skip_overwall0)
+
+        lines = []
+        for start, end in entry.sound_blocks:
+            text = decode_log_text(bytes(view[start:end]))
+            if len(text) > 0:
+                lines += [line.strip() for line in text.rstrip("\n").split("\n")]
+        sound_counts, sound_rejects = MapStatsParser._count_sounds(entry.mapname, lines, maxsounds)
+
+        return tile_stats, tile_rejects, sound_counts, sound_rejects
+
+
+    @staticmethod
+    def _log_cache_key(view: memoryview, entry: LogMapIndex, maxtiles: int, maxsounds: int, skip_overwall0: bool) -> bytes:
+        """ Key of a map load in the result cache, a hash of its tile and sound blocks, but not of its name. """
+        settings = ("log", len(entry.tile_blocks), maxtiles, maxsounds, skip_overwall0)
+        return ResultCache.key(settings, [view[start:end] for start, end in entry.tile_blocks + entry.sound_blocks])
+
+
+    @staticmethod
+    def parse_log_mmap(logpath: str, maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True,
+                       cache: Optional[ResultCache] = None):
+        """
+        Memory-maps the mapster32.log, scans it for map boundaries with scan_log and counts the statistics
+        of each map with count_indexed_maps. The log is never decoded as a whole, hence non-UTF-8 bytes are tolerated.
+        :param logpath: log file from which to read the dump
+        :param cache: result cache of previously counted maps, see count_indexed_maps
+        :return: Tuple: (tile_stats, tile_rejects, sound_stats, sound_rejects), see parse_log_streaming
+        """
+        with open(logpath, 'rb') as fd:
+            if os.fstat(fd.fileno()).st_size == 0:
+                result = MapStatsParser.count_indexed_maps(b"", [], maxtiles, maxsounds, skip_overwall0)
+            else:
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    index = MapStatsParser.scan_log(mm)
+                    result = MapStatsParser.count_indexed_maps(mm, index, maxtiles, maxsounds, skip_overwall0, cache)
+        print("Statistics parsed from log file")
+        return result
+
+
+    @staticmethod
+    def parse_log_out_of_core(logpath: str, directory: str, maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True):
+        """
+        Like parse_log_mmap, but writes the statistics of each map into an OutOfCoreStats in the given directory
+        as soon as the map is counted, instead of keeping them in memory.
+        The returned statistics are mappings that read each map from disk when it is accessed.
+        :param logpath: log file from which to read the dump
+        :param directory: directory for the disk-backed statistics, which are kept after the run
+        :return: Tuple: (tile_stats, tile_rejects, sound_stats, sound_rejects), see parse_log_streaming
+        """
+        tile_rejects: Dict[str, List[str]] = dict()
+        sound_rejects: Dict[str, List[str]] = dict()
+        with open(logpath, 'rb') as fd:
+            if os.fstat(fd.fileno()).st_size == 0:
+                stats = OutOfCoreStats(directory, [], maxtiles, maxsounds)
+            else:
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    index = MapStatsParser.scan_log(mm)
+                    stats = OutOfCoreStats(directory, list(dict.fromkeys(entry.mapname for entry in index)), maxtiles, maxsounds)
+                    with log_view(mm) as view:
+                        for entry in index:
+                            tstats, tile_rejects[entry.mapname], scounts, sound_rejects[entry.mapname] = \
+                                MapStatsParser._count_indexed_map(view, entry, maxtiles, maxsounds, skip_overwall0)
+                            stats.add_map(entry.mapname, tstats, scounts)
+        stats.finish()
+        print("Statistics parsed from log file")
+        return stats.tile_stats(), tile_rejects, stats.sound_stats(), sound_rejects
+
+
+    @staticmethod
+    def parse_log_parallel(logpath: str, maxtiles: int, jobs: int, maxsounds: int = 16384, skip_overwall0: bool = True,
+                           cache: Optional[ResultCache] = None):
+        """
+        Parallel version of parse_log_mmap. The log is scanned for map boundaries once, after which the map index is
+        split into contiguous byte ranges of similar size. Each range is counted by a worker process, which returns
+        the sparse statistics of its maps. The results are merged in log order and are identical to the serial path.
+        :param logpath: log file from which to read the dump
+        :param maxtiles: Maximum expected tilenum, see aggregate_tilestats.
+        :param jobs: Number of worker processes.
+        :param cache: if given, only the maps that are not in the result cache are sent to the workers
+        :return: Tuple: (tile_stats, tile_rejects, sound_stats, sound_rejects), see parse_log_streaming
+        """
+        if jobs <= 1 or os.path.getsize(logpath) == 0:
+            return MapStatsParser.parse_log_mmap(logpath, maxtiles, maxsounds, skip_overwall0, cache)
+
+        keys: List[Optional[bytes]] = []
+        with open(logpath, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            index = MapStatsParser.scan_log(mm)
+            if cache is not None:
+                with log_view(mm) as view:
+                    keys = [MapStatsParser._log_cache_key(view, entry, maxtiles, maxsounds, skip_overwall0) for entry in index]
+        results, pending = MapStatsParser._lookup_cached(keys, len(index), cache)
+
+        chunks = MapStatsParser._split_index([index[i] for i in pending], 4 * jobs)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_count_log_chunk, logpath, chunk, maxtiles, maxsounds, skip_overwall0) for chunk in chunks]
+            counted = (r[1:] for future in futures for r in future.result())
+            MapStatsParser._store_counted(results, keys, pending, counted, cache)
+
+        tile_stats: Dict[str, SparseStats] = dict()
+        tile_rejects: Dict[str, List[str]] = dict()
+        sound_counts: Dict[str, SoundCounts] = dict()
+        sound_rejects: Dict[str, List[str]] = dict()
+        for entry, (tstats, trej, scounts, srej) in zip(index, results):
+            tile_stats[entry.mapname] = tstats
+            tile_rejects[entry.mapname] = trej
+            sound_counts[entry.mapname] = scounts
+            sound_rejects[entry.mapname] = srej
+        print("Statistics parsed from log file")
+
+        MapStatsParser._add_tilestats_total(tile_stats, maxtiles)
+        return tile_stats, tile_rejects, MapStatsParser._soundstats_to_arrays(sound_counts), sound_rejects
+
+
+    @staticmethod
+    def parse_log_incremental(logpath: str, checkpoint_path: str, maxtiles: int, maxsounds: int = 16384, skip_overwall0: bool = True):
+        """
+        Resumable version of parse_log_mmap. The checkpoint stores the offset up to which the log was ingested,
+        together with the compact per-map results and the running cross-map total. If the checkpoint matches the log,
+        only the maps that were appended since are counted and merged into the stored results. The last map
+        of the previous run is always counted again, as its search may not have been complete yet.
+        If the log was truncated or rotated, or the settings differ, the whole log is parsed instead.
+        The checkpoint is not written by this function, see save_checkpoint.
+        :param logpath: log file from which to read the dump
+        :param checkpoint_path: path of the checkpoint file from a previous run, may not exist
+        :return: Tuple: (tile_stats, tile_rejects, sound_stats, sound_rejects, affected, checkpoint)
+                 affected: set of map names whose results were updated, None if the whole log was parsed.
+                 checkpoint: the new checkpoint state, to be stored with save_checkpoint once the outputs are written.
+        """
+        settings = (maxtiles, maxsounds, skip_overwall0)
+        state = None
+        if os.path.exists(checkpoint_path):
+            try:
+                with open(checkpoint_path, 'rb') as fd:
+                    state = pickle.load(fd)
+                if type(state) != dict or state.get("version") != CHECKPOINT_VERSION or state["settings"] != settings \
+                        or state["logpath"] != os.path.abspath(logpath):
+                    print(f"Checkpoint '{checkpoint_path}' does not match the current run, parsing the whole log")
+                    state = None
+                else:
+                    state["maps"] = {k: MapStatsParser._from_plain_record(v) for k, v in state["maps"].items()}
+            except Exception as ex:
+                print(f"Checkpoint '{checkpoint_path}' cannot be read ({type(ex).__name__}: {ex}), parsing the whole log")
+                state = None
+
+        with open(logpath, 'rb') as fd:
+            size = os.fstat(fd.fileno()).st_size
+            with (mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else memoryview(b"")) as mm:
+                if state is not None and (state["offset"] > size or MapStatsParser._log_digests(mm, state["offset"]) != state["digests"]):
+                    print(f"Log file '{logpath}' was truncated or rotated, parsing the whole log")
+                    state = None
+
+                affected = None if state is None else set()
+                if state is None:
+                    state = {"version": CHECKPOINT_VERSION, "logpath": os.path.abspath(logpath), "settings": settings,
+                             "offset": 0, "maps": dict(),
+                             "total": np.zeros((len(tile_categories) + 1, maxtiles), dtype=np.int64)}
+
+                index = MapStatsParser.scan_log(mm, state["offset"])
+                with log_view(mm) as view:
+                    for entry in index:
+                        tstats, trej, scounts, srej = MapStatsParser._count_indexed_map(view, entry, maxtiles, maxsounds, skip_overwall0)
+                        if entry.mapname in state["maps"]:
+                            old = state["maps"][entry.mapname][0]
+                            state["total"][:, old.indices] -= old.counts
+                        state["total"][:, tstats.indices] += tstats.counts
+                        state["maps"][entry.mapname] = (tstats, trej, scounts, srej)
+                        if affected is not None:
+                            affected.add(entry.mapname)
+
+                if len(index) > 0:
+                    state["offset"] = index[-1].offset
+                state["digests"] = MapStatsParser._log_digests(mm, state["offset"])
+        print("Statistics parsed from log file")
+
+        tile_stats: Dict[str, SparseStats] = dict()
+        tile_rejects: Dict[str, List[str]] = dict()
+        sound_counts: Dict[str, SoundCounts] = dict()
+        sound_rejects: Dict[str, List[str]] = dict()
+        for mapname, (tstats, trej, scounts, srej) in state["maps"].items():
+            tile_stats[mapname] = tstats
+            tile_rejects[mapname] = trej
+            sound_counts[mapname] = scounts
+            sound_rejects[mapname] = srej
+        if len(tile_stats) > 1:
+            tile_stats["total"] = SparseStats.from_histogram(tile_categories + ("total",), state["total"])
+
+        return tile_stats, tile_rejects, MapStatsParser._soundstats_to_arrays(sound_counts), sound_rejects, affected, state
+
+
+    @staticmethod
+    def _to_plain_record(result: tuple) -> tuple:
+        """
+        Converts (tile_stats, tile_rejects, sound_counts, sound_rejects) of a map into plain values, as stored in the
+        result cache and the checkpoint. Pickles of these do not refer to the classes of this module, which would
+        be pickled as __main__ classes when run as a script.
+        """
+        tstats, trej, scounts, srej = result
+        return tuple(tstats.columns), tstats.indices, tstats.counts, tstats.size, list(trej), \
+            tuple(scounts.emitters), scounts.counts, list(srej)
+
+
+    @staticmethod
+    def _from_plain_record(record: tuple) -> tuple:
+        """ Inverse of _to_plain_record. Raises TypeError or ValueError if the record is malformed. """
+        columns, indices, counts, size, trej, emitters, scounts, srej = record
+        return SparseStats(columns, indices, counts, size), trej, SoundCounts(tuple(emitters), scounts), srej
+
+
+    @staticmethod
+    def _cache_get(cache: ResultCache, key: bytes) -> Optional[tuple]:
+        """ Looks up the statistics of a map in the cache, see _to_plain_record. Malformed records are misses. """
+        record = cache.get(key)
+        if record is None:
+            return None
+        try:
+            return MapStatsParser._from_plain_record(record)
+        except (TypeError, ValueError):
+            return None
+
+
+    @staticmethod
+    def _lookup_cached(keys: List[Optional[bytes]], count: int, cache: Optional[ResultCache]) -> Tuple[List[Optional[tuple]], List[int]]:
+        """
+        Looks up the results of the given maps in the cache. Of maps with the same key, only the first is looked up.
+        :param keys: cache key of each map, None if the map has no key. Ignored without a cache.
+        :param count: number of maps
+        :return: Tuple: (results, pending), the cached result of each map or None, and the positions of the maps
+                 that need to be counted
+        """
+        results: List[Optional[tuple]] = [None] * count
+        if cache is None:
+            return results, list(range(count))
+        pending = []
+        seen = set()
+        for i, key in enumerate(keys):
+            if key is not None and key in seen:
+                continue
+            if key is not None:
+                seen.add(key)
+                results[i] = MapStatsParser._cache_get(cache, key)
+            if results[i] is None:
+                pending.append(i)
+        return results, pending
+
+
+    @staticmethod
+    def _store_counted(results: List[Optional[tuple]], keys: List[Optional[bytes]], pending: List[int],
+                       counted: Iterable[tuple], cache: Optional[ResultCache]) -> None:
+        """
+        Fills in the results of the maps counted after _lookup_cached, in the order of pending, and adds them
+        to the cache. Results that are errors (strings) are not cached. Maps that share their key with an
+        earlier map are then given the result of that map.
+        """
+        for i, result in zip(pending, counted):
+            results[i] = result
+            if cache is not None and keys[i] is not None and not isinstance(result, str):
+                cache.put(keys[i], MapStatsParser._to_plain_record(result))
+        if cache is not None:
+            first: Dict[bytes, int] = dict()
+            for i, key in enumerate(keys):
+                if key is not None:
+                    results[i] = results[first.setdefault(key, i)]
+
+
+    @staticmethod
+    def save_checkpoint(checkpoint_path: str, checkpoint: dict) -> None:
+        """ Stores the checkpoint state returned by parse_log_incremental, with the map results as plain records. """
+        plain = dict(checkpoint, maps={k: MapStatsParser._to_plain_record(v) for k, v in checkpoint["maps"].items()})
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, 'wb') as fd:
+            pickle.dump(plain, fd, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, checkpoint_path)
+
+
+    @staticmethod
+    def _log_digests(buf, offset: int) -> Tuple[bytes, bytes]:
+        """
+        Fingerprint of the log up to the given offset, used to detect truncation and rotation.
+        Consists of hashes of the start of the log, and of the bytes right before the offset.
+        """
+        head = hashlib.sha1(buf[0:min(offset, 65536)]).digest()
+        tail = hashlib.sha1(buf[max(0, offset - 4096):offset]).digest()
+        return head, tail
+
+
+    @staticmethod
+    def _split_index(index: List[LogMapIndex], nchunks: int) -> List[List[LogMapIndex]]:
+        """ Splits the map index into at most nchunks contiguous parts, each covering a similar number of bytes. """
+        sizes = np.array([sum(e - s for s, e in entry.tile_blocks + entry.sound_blocks) + 1 for entry in index])
+        if len(sizes) == 0:
+            return []
+        bounds = np.searchsorted(np.cumsum(sizes), np.linspace(0, sizes.sum(), nchunks + 1)[1:-1], side="right")
+        bounds = np.unique(np.concatenate(([0], bounds, [len(index)])))
+        return [index[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
     @staticmethod
     def aggregate_tilestats(tpm: Dict[str, List[str]], maxtiles: int, skip_overwall0: bool = True):
         """
@@ -118,63 +1624,163 @@ class MapStatsParser:
                                hence they are not actually using this tile.
                                Default is true. Set to false to count these as well.
         :return: Tuple: (tile_stats, reject_stats)
-                 tile_stats: Dict of aggregates stats for each map. Each dict entry is a dict with the following keys:
+                 tile_stats: Dict of aggregates stats for each map. Each dict entry is a SparseStats with the columns:
                     {"sprite", "floor", "ceiling", "wall", "overwall", "total"}
-                    Each entry for these keys is a numpy array of `maxtiles` entries, storing the
+                    Each column can be retrieved as a numpy array of `maxtiles` entries, storing the
                     number of times the respective tile is used.
                  reject_stats: Dict of rejected tile lines (negative or too large tilenum)
         """
 
-        tile_stats: Dict[str, Dict[str, np.ndarray]] = dict()
+        tile_stats: Dict[str, SparseStats] = dict()
         reject_stats: Dict[str, List[str]] = dict()
-        for map_filename in tpm.keys():
+        for map_filename, lines in tpm.items():
+            codes, tidx = MapStatsParser._tile_lines_to_arrays(lines)
 
-            # use numpy arrays for correct tiles
-            newstats = {"sprite": np.zeros(maxtiles), "floor": np.zeros(maxtiles), "ceiling": np.zeros(maxtiles),
-                        "wall": np.zeros(maxtiles), "overwall": np.zeros(maxtiles)}
+            # rejected entries, reported in the order in which they appear in the log
+            rejected = (tidx < 0) | (tidx >= maxtiles)
+            newreject = MapStatsParser._report_tile_rejects(map_filename, tidx, rejected, lines, maxtiles)
 
-            # rejected entries
-            newreject = []
+            valid = ~rejected
+            tile_stats[map_filename] = MapStatsParser._count_tiles(codes[valid], tidx[valid], maxtiles, skip_overwall0)
+            reject_stats[map_filename] = newreject
 
-            for line in tpm[map_filename]:
-                k = line.split(sep=',')
-                ttype = k[0]
-                tidx = int(k[1])
+        MapStatsParser._add_tilestats_total(tile_stats, maxtiles)
+        return tile_stats, reject_stats
 
-                if tidx >= maxtiles:
-                    print(f"WARNING: Tile index {tidx} in map {map_filename} exceeds MAXTILES of {maxtiles}::{line}", file=sys.stderr)
-                    newreject.append(line)
-                elif tidx < 0:
-                    print(f"WARNING: Negative picnum {tidx} found in map {map_filename}::{line}", file=sys.stderr)
-                    newreject.append(line)
-                else:
-                    newstats[ttype][tidx] += 1
 
-            # overpicnum == 0 is transparent; don't count
-            if skip_overwall0:
-                newstats["overwall"][0] = 0
+    @staticmethod
+    def _report_tile_rejects(map_filename: str, tidx: np.ndarray, rejected: np.ndarray,
+                             lines: Union[List[str], Dict[int, str]], maxtiles: int) -> List[str]:
+        """ Prints a warning for each rejected tile line, and returns the rejected lines.
+            lines only needs to contain the rejected lines, indexed by their position. """
+        newreject = []
+        for i in np.flatnonzero(rejected):
+            if tidx[i] >= maxtiles:
+                print(f"WARNING: Tile index {tidx[i]} in map {map_filename} exceeds MAXTILES of {maxtiles}::{lines[i]}", file=sys.stderr)
+            else:
+                print(f"WARNING: Negative picnum {tidx[i]} found in map {map_filename}::{lines[i]}", file=sys.stderr)
+            newreject.append(lines[i])
+        return newreject
 
-            # aggregate total column for each map
-            maptotal = np.zeros(maxtiles)
-            for cat in newstats.keys():
-                maptotal += newstats[cat]
-            newstats["total"] = maptotal
 
-            tile_stats[map_filename] = newstats
-            reject_stats[map_filename] = newreject
+    @staticmethod
+    def _tile_lines_to_arrays(lines: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Converts the verbose tile lines of a single map into arrays of category codes and tile indices.
+        :param lines: tile lines of one map, format: "<category>,<tilenum>,"
+        :return: Tuple: (codes, tidx), see _tile_block_to_arrays
+        """
+        if len(lines) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return MapStatsParser._tile_block_to_arrays(("\n".join(lines) + "\n").encode("utf8"))
 
-        # aggregate total over all maps
-        if len(tile_stats.keys()) > 1:
-            allmaptotal = {"sprite": np.zeros(maxtiles), "floor": np.zeros(maxtiles), "ceiling": np.zeros(maxtiles),
-                           "wall": np.zeros(maxtiles), "overwall": np.zeros(maxtiles), "total": np.zeros(maxtiles)}
 
-            for k in tile_stats.keys():
-                for cat in tile_stats[k].keys():
-                    allmaptotal[cat] += tile_stats[k][cat]
+    @staticmethod
+    def _tile_block_to_arrays(block: bytes) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Converts a block of verbose tile lines into arrays of category codes and tile indices, without
+        splitting the block into individual lines. The category code is the position of the category in
+        `tile_categories`. Lines that would not be accepted by aggregate_tilestats, i.e. whose category
+        is unknown, or whose tile index is not a decimal integer, raise a ValueError.
+        :param block: bytes-like object containing the tile lines of one map, separated by newlines
+        :return: Tuple: (codes, tidx), both integer arrays with one entry per line.
+        """
+        buf = np.frombuffer(block, dtype=np.uint8)
+        if len(buf) > 0 and buf[-1] == ord("\n"):
+            buf = buf[:-1]
+        if len(buf) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        newlines = np.flatnonzero(buf == ord("\n"))
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.concatenate((newlines, [len(buf)]))
+        codes = _tile_code_lookup[buf[np.minimum(starts, len(buf) - 1)]]
+
+        # the line must start with the full category name, followed by a comma
+        malformed = codes < 0
+        for i, prefix in enumerate(_tile_name_prefixes):
+            rows = np.flatnonzero(codes == i)
+            pos = starts[rows, None] + np.arange(len(prefix))
+            malformed[rows] |= (pos[:, -1] >= ends[rows]) | (buf[np.minimum(pos, len(buf) - 1)] != prefix).any(axis=1)
+        if not malformed.any():
+            tidx, malformed = MapStatsParser._parse_integers(buf, starts + _tile_name_lengths[codes] + 1, ends)
+        if malformed.any():
+            i = np.flatnonzero(malformed)[0]
+            line = bytes(buf[starts[i]:ends[i]]).decode("utf8", errors="replace")
+            # the traceback keeps this frame alive, which must not hold on to a slice of the log, see log_view
+            del buf, block
+            raise ValueError(f"Malformed tile statistics line::{line.strip()}")
+
+        return codes, tidx
 
-            tile_stats["total"] = allmaptotal
 
-        return tile_stats, reject_stats
+    @staticmethod
+    def _parse_integers(buf: np.ndarray, pos: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Parses the signed decimal integers starting at the given positions of a byte buffer, all at once.
+        Each integer ends at the next comma, or at the end of its line. Values beyond the range of int64
+        are clamped to it, such that they are still rejected as out of range.
+        :param buf: uint8 array of text
+        :param pos: start position of each integer
+        :param ends: end position of the line of each integer
+        :return: Tuple: (values, malformed) where malformed marks the integers that are empty,
+                 or contain anything but digits after the optional minus sign.
+        """
+        n = len(buf)
+        commas = np.append(np.flatnonzero(buf == ord(",")), n)
+        stop = np.minimum(commas[np.searchsorted(commas, pos)], ends)
+        negative = (pos < stop) & (buf[np.minimum(pos, n - 1)] == ord("-"))
+        pos = pos + negative
+        ndigits = stop - pos
+
+        # number of non-digit characters before each position, to check that the integers only contain digits
+        nondigits = np.concatenate(([0], np.cumsum((buf < ord("0")) | (buf > ord("9")))))
+        malformed = (ndigits <= 0) | (nondigits[np.maximum(stop, pos)] != nondigits[pos])
+
+        # at most 18 digits fit into int64 without overflow
+        values = np.zeros(len(pos), dtype=np.int64)
+        for k in range(min(int(ndigits.max(initial=0)), 18)):
+            digit = buf[np.minimum(pos + k, n - 1)].astype(np.int64) - ord("0")
+            values = np.where(k < ndigits, values * 10 + digit, values)
+        values[ndigits > 18] = np.iinfo(np.int64).max
+        values[negative] *= -1
+        return values, malformed
+
+
+    @staticmethod
+    def _count_tiles(codes: np.ndarray, tidx: np.ndarray, maxtiles: int, skip_overwall0: bool,
+                     weights: Optional[np.ndarray] = None) -> SparseStats:
+        """
+        Computes the per-category tile histograms of a single map, plus the total column.
+        :param codes: category codes, as returned by _tile_lines_to_arrays
+        :param tidx: tile indices, all of which must be within [0, maxtiles)
+        :param maxtiles: Maximum expected tilenum, determines the size of the columns.
+        :param skip_overwall0: Whether to skip transparent overwalls, see aggregate_tilestats.
+        :param weights: Optional number of occurrences of each (code, tidx) pair, one by default.
+        :return: sparse tile counts for each category, and the total column
+        """
+        # only the used tiles are counted, hence the histogram does not depend on maxtiles
+        used, inverse = np.unique(tidx, return_inverse=True)
+        ncats = len(tile_categories)
+        hist = np.zeros((ncats + 1, len(used)), dtype=np.int64)
+        hist[:ncats] = np.bincount(codes * len(used) + inverse.reshape(-1), weights=weights,
+                                   minlength=ncats * len(used)).reshape(ncats, len(used))
+
+        # overpicnum == 0 is transparent; don't count
+        if skip_overwall0 and len(used) > 0 and used[0] == 0:
+            hist[tile_categories.index("overwall"), 0] = 0
+        hist[ncats] = hist[:ncats].sum(axis=0)
+
+        # drop tiles that are no longer used after skipping overwalls
+        keep = hist[ncats] != 0
+        return SparseStats(tile_categories + ("total",), used[keep].astype(np.int32), hist[:, keep].astype(COUNT_DTYPE), maxtiles)
+
+
+    @staticmethod
+    def _add_tilestats_total(tile_stats: Dict[str, SparseStats], maxtiles: int) -> None:
+        """ Adds the "total" entry summing up the tile stats of all maps, if there is more than one map. """
+        if len(tile_stats.keys()) > 1:
+            tile_stats["total"] = SparseStats.sum(list(tile_stats.values()))
 
 
     @staticmethod
@@ -192,109 +1798,189 @@ class MapStatsParser:
         reject_stats = dict()
 
         for map_filename in spm.keys():
-            sound_by_emitter = dict()
-            newreject = []
+            sound_stats[map_filename], reject_stats[map_filename] = \
+                MapStatsParser._count_sounds(map_filename, spm[map_filename], maxsounds)
 
-            for line in spm[map_filename]:
-                k = line.split(sep=',')
-                stype = k[0]
-                sidx = int(k[1])
-
-                if sidx < 0:
-                    print(f"WARNING: Negative sound index {sidx} found in map {map_filename}::{line}", file=sys.stderr)
-                    newreject.append(line)
-                elif sidx > maxsounds:
-                    print(f"WARNING: Sound index {sidx} in map {map_filename} exceeds maxsounds of {maxsounds}::{line}", file=sys.stderr)
-                    newreject.append(line)
-                else:
-                    # If emitter is not known yet, create dict for it
-                    if stype not in sound_by_emitter:
-                        sound_by_emitter[stype] = dict()
+        return MapStatsParser._soundstats_to_arrays(sound_stats), reject_stats
 
-                    # If index unknown, add to dict
-                    if sidx not in sound_by_emitter[stype]:
-                        sound_by_emitter[stype][sidx] = 0
 
-                    sound_by_emitter[stype][sidx] += 1
+    @staticmethod
+    def _count_sounds(map_filename: str, lines: List[str], maxsounds: int) -> Tuple[SoundCounts, List[str]]:
+        """
+        Counts the sound lines of a single map.
+        :param map_filename: Name of the map, used for warnings.
+        :param lines: sound lines of the map, format: "<emitter>,<soundnum>,"
+        :param maxsounds: Maximum sound index.
+        :return: Tuple: (sound_counts, rejects)
+        """
+        overflow_emitters: Dict[str, int] = dict()
+        codes, sidx = [], []
+        newreject = []
+
+        for line in lines:
+            k = line.split(sep=',')
+            index = int(k[1])
+
+            if index < 0:
+                print(f"WARNING: Negative sound index {index} found in map {map_filename}::{line}", file=sys.stderr)
+                newreject.append(line)
+            elif index > maxsounds:
+                print(f"WARNING: Sound index {index} in map {map_filename} exceeds maxsounds of {maxsounds}::{line}", file=sys.stderr)
+                newreject.append(line)
+            else:
+                code = _sound_emitter_codes.get(k[0])
+                if code is None:
+                    code = overflow_emitters.setdefault(k[0], len(sound_emitters) + len(overflow_emitters))
+                codes.append(code)
+                sidx.append(index)
+
+        return MapStatsParser._sound_histogram(codes, sidx, tuple(overflow_emitters)), newreject
 
-            sound_stats[map_filename] = sound_by_emitter
-            reject_stats[map_filename] = newreject
 
-        # after stats are collected, reformat into numpy arrays and compute totals
+    @staticmethod
+    def _sound_histogram(codes: List[int], sidx: List[int], overflow_emitters: Tuple[str, ...]) -> SoundCounts:
+        """
+        Counts the sounds of a single map with one bincount into an (emitters x highest sound index + 1) matrix.
+        :param codes: emitter code of each valid sound line
+        :param sidx: sound index of each valid sound line
+        :param overflow_emitters: names of the emitters with codes starting at len(sound_emitters)
+        :return: counts of the emitters that occur in the map
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        sidx = np.asarray(sidx, dtype=np.int64)
+        nemitters = len(sound_emitters) + len(overflow_emitters)
+        width = int(sidx.max()) + 1 if len(sidx) > 0 else 1
+
+        hist = np.bincount(codes * width + sidx, minlength=nemitters * width).reshape(nemitters, width)
+        present = np.flatnonzero(np.bincount(codes, minlength=nemitters))
+        names = sound_emitters + overflow_emitters
+        return SoundCounts(tuple(names[i] for i in present), hist[present].astype(COUNT_DTYPE))
+
+
+    @staticmethod
+    def _sum_sound_counts(counts: List[SoundCounts]) -> SoundCounts:
+        """
+        Sums up the sound counts of several searches of the same map, with the same result as if their sound lines
+        had been counted at once by _count_sounds.
+        :param counts: sound counts of each search
+        :return: counts of the emitters that occur in any of the searches, in emitter code order
+        """
+        emitter_codes = dict(_sound_emitter_codes)
+        for sc in counts:
+            for e in sc.emitters:
+                emitter_codes.setdefault(e, len(emitter_codes))
+
+        width = max(sc.counts.shape[1] for sc in counts)
+        hist = np.zeros((len(emitter_codes), width), dtype=np.uint64)
+        present = np.zeros(len(emitter_codes), dtype=bool)
+        for sc in counts:
+            rows = [emitter_codes[e] for e in sc.emitters]
+            hist[rows, :sc.counts.shape[1]] += sc.counts
+            present[rows] = True
+
+        names = tuple(emitter_codes)
+        return SoundCounts(tuple(names[i] for i in np.flatnonzero(present)), hist[present].astype(COUNT_DTYPE))
+
+
+    @staticmethod
+    def _soundstats_to_arrays(sound_stats: Dict[str, SoundCounts]) -> Dict[str, Dict[str, np.ndarray]]:
+        """
+        Reformats the collected sound counts into a dict of arrays per map, and computes the totals per map and over all maps.
+        The arrays of each map are sized to the highest sound index of the map, those of the total over all maps
+        to the highest sound index overall.
+        :param sound_stats: Dict of maps, storing the sound counts of each map.
+        :return: dict of dicts, storing number of times sounds are used per emitter type
+        """
         new_sound_dict = dict()
-        for k in sound_stats.keys():
-            new_sound_dict[k] = dict()
-            emitters = sound_stats[k].keys()  # emitters
-
-            map_maxsound = 0
-            for e in emitters:
-                emitter_max = max(sound_stats[k][e].keys())
-                if emitter_max > map_maxsound:
-                    map_maxsound = emitter_max
-
-            total_stats = np.zeros(map_maxsound + 1)
-            for e in emitters:
-                stat_array = np.zeros(map_maxsound + 1)
-                for index, count in sound_stats[k][e].items():
-                    stat_array[index] = count
-                new_sound_dict[k][e] = stat_array
-                total_stats += stat_array
-
-            new_sound_dict[k]["total"] = total_stats
-
-        # aggregate total over all maps
-        if len(new_sound_dict.keys()) > 1:
-            allmaptotal = dict()
-            max_len = 0
-            for k in new_sound_dict.keys():
-                for cat in new_sound_dict[k].keys():
-                    if cat not in allmaptotal:
-                        allmaptotal[cat] = np.zeros(new_sound_dict[k][cat].shape)
-                    if len(new_sound_dict[k][cat]) > len(allmaptotal[cat]):
-                        allmaptotal[cat].resize(new_sound_dict[k][cat].shape)
+        for k, sc in sound_stats.items():
+            new_sound_dict[k] = dict(zip(sc.emitters, sc.counts))
+            new_sound_dict[k]["total"] = sc.counts.sum(axis=0, dtype=COUNT_DTYPE)
 
-                    allmaptotal[cat] += np.resize(new_sound_dict[k][cat], allmaptotal[cat].shape)
-                    if allmaptotal[cat].shape[0] > max_len:
-                        max_len = allmaptotal[cat].shape[0]
+        # aggregate total over all maps, in a single matrix of all emitter codes
+        if len(new_sound_dict.keys()) > 1:
+            emitter_codes = dict(_sound_emitter_codes)
+            for sc in sound_stats.values():
+                for e in sc.emitters:
+                    emitter_codes.setdefault(e, len(emitter_codes))
 
-            for cat in allmaptotal:
-                allmaptotal[cat].resize((max_len,))
+            width = max(sc.counts.shape[1] for sc in sound_stats.values())
+            allmaptotal = np.zeros((len(emitter_codes), width), dtype=np.uint64)
+            present = np.zeros(len(emitter_codes), dtype=bool)
+            for sc in sound_stats.values():
+                rows = [emitter_codes[e] for e in sc.emitters]
+                allmaptotal[rows, :sc.counts.shape[1]] += sc.counts
+                present[rows] = True
 
-            new_sound_dict["total"] = allmaptotal
+            allmaptotal = narrow_counts(allmaptotal)
+            names = list(emitter_codes)
+            new_sound_dict["total"] = {names[i]: allmaptotal[i] for i in np.flatnonzero(present)}
+            new_sound_dict["total"]["total"] = narrow_counts(allmaptotal.sum(axis=0, dtype=np.uint64))
 
-        return new_sound_dict, reject_stats
+        return new_sound_dict
 
 
-    def start_database(self):
+    def start_database(self, journal_mode: Optional[str] = None, synchronous: Optional[str] = None):
         """ establish a connection with the sqlite database
-            creates the file if not present """
+            creates the file if not present
+            All changes are made in a single transaction, which is committed by close_database.
+            :param journal_mode: if given, sets the journal_mode pragma, e.g. "WAL" for bulk loads
+            :param synchronous: if given, sets the synchronous pragma, e.g. "OFF" for bulk loads """
         if self.stats_db is not None:
             raise RuntimeError("Database connection already established")
-        self.stats_db = sqlite3.connect(DBPATH)
+        self.stats_db = sqlite3.connect(DBPATH, isolation_level=None)
+        if journal_mode is not None:
+            self.stats_db.execute(f"PRAGMA journal_mode={journal_mode}")
+        if synchronous is not None:
+            self.stats_db.execute(f"PRAGMA synchronous={synchronous}")
+        self.stats_db.execute("BEGIN")
 
 
     def close_database(self):
         """ Commits and closes the connection. """
         if self.stats_db is None:
             raise RuntimeError("No database connection")
-        self.stats_db.commit()
+        if self.stats_db.in_transaction:
+            self.stats_db.execute("COMMIT")
         self.stats_db.close()
         self.stats_db = None
 
 
+    def commit_database(self):
+        """ Commits the pending changes, and begins a new transaction. """
+        if self.stats_db is None:
+            raise RuntimeError("No database connection")
+        if self.stats_db.in_transaction:
+            self.stats_db.execute("COMMIT")
+        self.stats_db.execute("BEGIN")
+
+
     def db_setup_table(self, schema_file:str, mapname: str):
         """ Initializes the tables for the given map name.
             Deletes existing tables for this map. """
         if self.stats_db is None:
             raise RuntimeError("No database connection")
 
-        c = self.stats_db.cursor()
-        with open(schema_file, 'r') as f:
-            initial_commands = f.read()
-            initialize_maptable = initial_commands.replace("<REPLACE_MAPNAME>", mapname)
-            c.executescript(initialize_maptable)
-        c.close()
-        self.stats_db.commit()
+        # executescript would commit the pending transaction, hence run each statement separately
+        with self.profile_phase("schema"):
+            for statement in self.db_schema_statements(schema_file):
+                self.stats_db.execute(statement.replace("<REPLACE_MAPNAME>", mapname))
+
+
+    def db_schema_statements(self, schema_file: str) -> List[str]:
+        """ Returns the statements of the given schema file, which is only read once. """
+        if schema_file not in self.schema_cache:
+            with open(schema_file, 'r') as f:
+                self.schema_cache[schema_file] = split_sql_script(f.read())
+        return self.schema_cache[schema_file]
+
+
+    def db_insert_columns(self, table: str, col_names: List[str], cols: List[np.ndarray]):
+        """ Inserts the given columns into the table, with the row index as id.
+            All values are converted to integers column-wise and inserted with a single executemany. """
+        command_string = f"INSERT INTO {table} (id,{','.join(col_names)}) VALUES (?{',?' * len(cols)});"
+        with self.profile_phase("insert"):
+            rows = zip(range(len(cols[0])), *[np.asarray(v).astype(np.int64).tolist() for v in cols])
+            self.stats_db.executemany(command_string, rows)
 
 
     def export_tiles_to_sqlite(self, stat_dict: Dict):
@@ -307,15 +1993,12 @@ class MapStatsParser:
                 cleaned_mapname = "m" + cleaned_mapname
             self.db_setup_table(TILE_SCHEMA, cleaned_mapname)
 
+            col_names = []
             cols = []
-            command_string = f"INSERT INTO {cleaned_mapname}_tiles (id"
-            value_string = "VALUES (?"
 
             col:str
             for col, v in stats.items():
-                col_name = re.sub("\s", "_", col)
-                command_string += f",{col_name}"
-                value_string += ",?"
+                col_names.append(re.sub("\s", "_", col))
                 cols.append(v)
 
             for col, v in self.extra_tilestats.items():
@@ -324,20 +2007,10 @@ class MapStatsParser:
                     tiles_known_columns.add(col_name)
                     add_col_command = f"ALTER TABLE {cleaned_mapname}_tiles ADD {col_name} BINARY"
                     self.stats_db.execute(add_col_command)
-                command_string += f",{col_name}"
-                value_string += ",?"
+                col_names.append(col_name)
                 cols.append(v)
 
-            self.stats_db.commit()
-
-            command_string += ") " + value_string + ");"
-
-            mat = np.vstack(cols).transpose()
-            for i in range(mat.shape[0]):
-                vals = (i, *mat[i, :])
-                self.stats_db.execute(command_string, vals)
-
-            self.stats_db.commit()
+            self.db_insert_columns(f"{cleaned_mapname}_tiles", col_names, cols)
 
 
     def export_sounds_to_sqlite(self, stat_dict: Dict):
@@ -350,9 +2023,8 @@ class MapStatsParser:
                 cleaned_mapname = "m" + cleaned_mapname
             self.db_setup_table(SOUND_SCHEMA, cleaned_mapname)
 
+            col_names = []
             cols = []
-            command_string = f"INSERT INTO {cleaned_mapname}_sounds (id"
-            value_string = "VALUES (?"
 
             # Yes this is prone to an SQL injection but screw it.
             col:str
@@ -365,54 +2037,177 @@ class MapStatsParser:
                     sounds_known_columns.add(col_name)
                     add_col_command = f"ALTER TABLE {cleaned_mapname}_sounds ADD {col_name} INTEGER"
                     self.stats_db.execute(add_col_command)
-                command_string += f",{col_name}"
-                value_string += ",?"
+                col_names.append(col_name)
                 cols.append(v)
 
-            self.stats_db.commit()
+            self.db_insert_columns(f"{cleaned_mapname}_sounds", col_names, cols)
 
-            command_string += ") " + value_string + ");"
 
-            mat = np.vstack(cols).transpose()
-            for i in range(mat.shape[0]):
-                vals = (i, *mat[i, :])
-                self.stats_db.execute(command_string, vals)
+    def export_to_normalized_sqlite(self, tile_stats: Dict, sound_stats: Dict):
+        """
+        Export the tile and sound statistics into the normalized schema of NORMALIZED_SCHEMA.
+        Instead of two dense tables per map, there is a single `maps` table, and the tables `tile_usage` and
+        `sound_usage` which only store the nonzero counts for each map, indexed by map and by tile or sound.
+        The extra_input arrays are stored once in the `tile_flags` table. The total columns and the total
+        over all maps are not stored, as they can be computed with SUM queries.
+        Maps that already exist in the database have their previous rows replaced.
+        """
+        if self.stats_db is None:
+            raise RuntimeError("No database connection")
+        for statement in self.db_schema_statements(NORMALIZED_SCHEMA):
+            self.stats_db.execute(statement)
+
+        for mapname in list(tile_stats.keys()) + [k for k in sound_stats.keys() if k not in tile_stats]:
+            if mapname == "total":
+                continue
+            map_id = self.db_normalized_map_id(mapname)
+            if mapname in tile_stats:
+                self.stats_db.execute("DELETE FROM tile_usage WHERE map_id = ?;", (map_id,))
+                self.db_insert_nonzero("tile_usage", map_id, tile_stats[mapname])
+            if mapname in sound_stats:
+                self.stats_db.execute("DELETE FROM sound_usage WHERE map_id = ?;", (map_id,))
+                self.db_insert_nonzero("sound_usage", map_id, sound_stats[mapname])
+
+        self.stats_db.execute("DELETE FROM tile_flags;")
+        for flag, v in self.extra_tilestats.items():
+            nonzero = np.flatnonzero(v)
+            self.stats_db.executemany("INSERT INTO tile_flags (flag, tile, value) VALUES (?,?,?);",
+                                      zip([flag] * len(nonzero), nonzero.tolist(), v[nonzero].astype(np.int64).tolist()))
+
+
+    def db_normalized_map_id(self, mapname: str) -> int:
+        """ Returns the id of the map in the `maps` table of the normalized schema, adding the map if needed. """
+        name = re.sub('.*/', '', map_ext_pattern.sub('', mapname))
+        self.stats_db.execute("INSERT OR IGNORE INTO maps (path, name) VALUES (?,?);", (mapname, name))
+        return self.stats_db.execute("SELECT id FROM maps WHERE path = ?;", (mapname,)).fetchone()[0]
+
+
+    def db_insert_nonzero(self, table: str, map_id: int, stats: Dict[str, np.ndarray]):
+        """ Inserts the nonzero counts of each column except the total into a usage table of the normalized schema. """
+        index_col, name_col = ("tile", "category") if table == "tile_usage" else ("sound", "emitter")
+        with self.profile_phase("insert"):
+            rows = []
+            for col in stats.keys():
+                if col == "total":
+                    continue
+                if isinstance(stats, SparseStats):
+                    nonzero, counts = stats.nonzero(col)
+                else:
+                    nonzero = np.flatnonzero(stats[col])
+                    counts = stats[col][nonzero]
+                rows += zip([map_id] * len(nonzero), nonzero.tolist(), [col] * len(nonzero), counts.astype(np.int64).tolist())
+            self.stats_db.executemany(f"INSERT INTO {table} (map_id, {index_col}, {name_col}, count) VALUES (?,?,?,?);", rows)
 
-            self.stats_db.commit()
+
+    def output_columns(self, stats: Dict[str, np.ndarray], insert_extras: bool = False) -> Tuple[List[str], List[np.ndarray]]:
+        """
+        Returns the column names and arrays of a single map, as written by the csv and xlsx exporters.
+        :param stats: statistics of the map, column name to array
+        :param insert_extras: whether to append the extra_input arrays, only for tile stats
+        :return: Tuple: (names, columns). The total column is placed behind sprite, wall etc., followed by the extras.
+        """
+        names = [col for col in stats.keys() if col != "total"] + ["total"]
+        cols = [stats[col] for col in names]
+        if insert_extras:
+            length = len(cols[-1])
+            for j, v in self.extra_tilestats.items():
+                names.append(j)
+                cols.append(fit_length(v, length))
+        return names, cols
 
 
     def export_stats_to_excel(self, stat_dict:dict, outfile_prefix:str, insert_extras:bool=False) -> None:
         """
         Export the given stats dictionary to excel format.
+        pandas and xlsxwriter are only imported here, as the other output formats do not require them.
         :param stat_dict:
         :param outfile_prefix:
         :return:
         """
+        import pandas as pd
+
         writer = pd.ExcelWriter(outfile_prefix +".xlsx", engine='xlsxwriter')
 
         for k in stat_dict.keys():
-            ts_dataframe = pd.DataFrame(stat_dict[k])
+            with self.profile_phase("dataframe"):
+                names, cols = self.output_columns(stat_dict[k], insert_extras)
+                ts_dataframe = pd.DataFrame(dict(zip(names, cols)))
+
+            mapname = re.sub('.*/', '', k)
+            with self.profile_phase("write"):
+                ts_dataframe.to_excel(writer, sheet_name=f"{mapname}", na_rep="N/A")
+
+        # xlsxwriter only writes the workbook to disk when closing
+        with self.profile_phase("write"):
+            writer.close()
 
-            # ensure this column is placed behind sprite, wall etc.
-            total_col = ts_dataframe.pop("total")
-            ts_dataframe.insert(len(ts_dataframe.columns), "total", total_col)
 
-            # only for tile stats
+    def export_stats_to_excel_streaming(self, stat_dict: dict, outfile_prefix: str, insert_extras: bool = False,
+                                        nonzero_rows: bool = False) -> None:
+        """
+        Export the given stats dictionary to excel format with xlsxwriter's constant_memory mode, in which each row
+        is written to disk as soon as it is complete. Memory usage hence does not depend on the number of maps.
+        The first sheet is a summary with the totals over all maps, the number of maps that use each index,
+        and the extra_input arrays. It is followed by one sheet per map, laid out as in export_stats_to_excel.
+        :param stat_dict: Dictionary containing the collected statistics
+        :param outfile_prefix: Filename prefix
+        :param insert_extras: whether to add the extra_input arrays, only for tile stats
+        :param nonzero_rows: only write the rows with a nonzero total, such that the workbook size depends
+                             on the number of tiles or sounds actually used
+        """
+        import xlsxwriter
+
+        workbook = xlsxwriter.Workbook(outfile_prefix + ".xlsx", {"constant_memory": True})
+        header_format = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        index_format = workbook.add_format({"bold": True, "border": 1, "valign": "top"})
+
+        def write_sheet(sheet, names, cols, rows):
+            sheet.write_row(0, 1, names, header_format)
+            col_lists = [np.asarray(v)[rows].tolist() for v in cols]
+            for r, row in enumerate(zip(rows.tolist(), *col_lists), start=1):
+                sheet.write_number(r, 0, row[0], index_format)
+                sheet.write_row(r, 1, row[1:])
+
+        # rows of a sheet may only be written in order, but the sheets can be filled in any order
+        summary_sheet = workbook.add_worksheet("summary")
+        maps_using = np.zeros(0, dtype=np.int64)
+        mapnames = [k for k in stat_dict.keys() if k != "total"]
+
+        for k in mapnames:
+            with self.profile_phase("columns"):
+                names, cols = self.output_columns(stat_dict[k], insert_extras)
+                total_col = np.asarray(cols[names.index("total")])
+                used = total_col != 0
+                if len(used) > len(maps_using):
+                    maps_using = fit_length(maps_using, len(used))
+                maps_using[:len(used)] += used
+                rows = np.flatnonzero(used) if nonzero_rows else np.arange(len(total_col))
+
+            with self.profile_phase("write"):
+                write_sheet(workbook.add_worksheet(re.sub('.*/', '', k)), names, cols, rows)
+
+        with self.profile_phase("write"):
+            # with a single map, there is no separate total
+            total_key = "total" if "total" in stat_dict else mapnames[0]
+            names, cols = self.output_columns(stat_dict[total_key], insert_extras=False)
+            length = len(cols[-1])
+            names.append("maps")
+            cols.append(fit_length(maps_using, length))
             if insert_extras:
                 for j, v in self.extra_tilestats.items():
-                    v.resize(total_col.shape)
-                    ts_dataframe.insert(len(ts_dataframe.columns), j, v)
+                    names.append(j)
+                    cols.append(fit_length(v, length))
+            rows = np.flatnonzero(cols[names.index("total")]) if nonzero_rows else np.arange(length)
+            write_sheet(summary_sheet, names, cols, rows)
 
-            mapname = re.sub('.*/', '', k)
-            ts_dataframe.to_excel(writer, sheet_name=f"{mapname}", na_rep="N/A")
-
-        writer.save()
-        writer.close()
+            workbook.close()
 
 
     def export_stats_to_csv(self, stat_dict: dict, outfile_prefix: str, insert_extras:bool = False) -> None:
         """
         Export the given stats dictionary to csv.
+        The rows are written directly from the count arrays, in the same format as pandas.DataFrame.to_csv:
+        an unnamed index column with the tile or sound index, followed by the columns of output_columns.
         :param stat_dict: Dictionary containing the collected statistics
         :param outfile_prefix: Filename prefix
         """
@@ -421,22 +2216,137 @@ class MapStatsParser:
             os.mkdir(outdir, mode=0o755)
 
         for k in stat_dict.keys():
-            ts_dataframe = pd.DataFrame(stat_dict[k])
-
-            # ensure this column is placed behind the others
-            total_col = ts_dataframe.pop("total")
-            ts_dataframe.insert(len(ts_dataframe.columns), "total", total_col)
-
-            # only for tile stats
-            if insert_extras:
-                for j, v in self.extra_tilestats.items():
-                    v.resize(total_col.shape)
-                    ts_dataframe.insert(len(ts_dataframe.columns), j, v)
+            names, cols = self.output_columns(stat_dict[k], insert_extras)
 
             mapname = map_ext_pattern.sub('', k)
             mapname = re.sub('.*/', '', mapname)
 
-            ts_dataframe.to_csv(f"{outdir}/{outfile_prefix}_{mapname}.csv", sep=',', na_rep="N/A", float_format="%d")
+            with self.profile_phase("write"):
+                with open(f"{outdir}/{outfile_prefix}_{mapname}.csv", "w", newline="") as fd:
+                    writer = csv.writer(fd, lineterminator=os.linesep)
+                    writer.writerow([""] + names)
+                    writer.writerows(zip(range(len(cols[0])), *[np.asarray(v).tolist() for v in cols]))
+
+    def export_stats_to_npz(self, tile_stats: Dict, sound_stats: Dict, outfile: str = NPZ_PATH) -> None:
+        """
+        Export the tile and sound statistics of all maps into a single uncompressed npz archive, as dense tensors.
+        The archive can be opened with np.load, or memory-mapped with load_stats_npz. It contains the arrays:
+            maps:           map names, in the order of the first tensor axis. The total over all maps is not included.
+            tiles:          (maps, tile_columns, maxtiles) tensor of tile counts
+            tile_columns:   tile categories, followed by the total per map
+            sounds:         (maps, sound_columns, highest sound index + 1) tensor of sound counts
+            sound_columns:  emitter types, in emitter code order, followed by the total per map
+            flags:          (flag_names, maxtiles) array of the extra_input indicator arrays
+            flag_names:     names of the extra_input indicator arrays
+        :param tile_stats: Dictionary containing the collected tile statistics
+        :param sound_stats: Dictionary containing the collected sound statistics
+        :param outfile: Path of the npz file
+        """
+        mapnames = [k for k in tile_stats.keys() if k != "total"]
+        tile_columns = list(tile_categories) + ["total"]
+
+        emitter_codes = dict(_sound_emitter_codes)
+        for k in mapnames:
+            for e in sound_stats[k].keys():
+                if e != "total":
+                    emitter_codes.setdefault(e, len(emitter_codes))
+        sound_columns = list(emitter_codes) + ["total"]
+        sound_width = max([len(sound_stats[k]["total"]) for k in mapnames] + [1])
+
+        # stored without compression, such that each array can be memory-mapped
+        with zipfile.ZipFile(outfile, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            with self.profile_phase("write"):
+                self._npz_write_array(zf, "maps", np.array(mapnames, dtype=str))
+                self._npz_write_array(zf, "tile_columns", np.array(tile_columns, dtype=str))
+                self._npz_write_array(zf, "sound_columns", np.array(sound_columns, dtype=str))
+                self._npz_write_array(zf, "flag_names", np.array(list(self.extra_tilestats.keys()), dtype=str))
+                self._npz_write_array(zf, "flags", np.array(list(self.extra_tilestats.values()), dtype=np.uint8).reshape(-1, self.maxtiles))
+
+            # the tensors are written one map at a time, without holding them in memory
+            with self.profile_phase("tiles"):
+                with self._npz_open_tensor(zf, "tiles", (len(mapnames), len(tile_columns), self.maxtiles)) as fd:
+                    for k in mapnames:
+                        block = np.zeros((len(tile_columns), self.maxtiles), dtype=COUNT_DTYPE)
+                        for i, col in enumerate(tile_columns):
+                            block[i] = fit_length(tile_stats[k][col], self.maxtiles)
+                        fd.write(block.tobytes())
+
+            with self.profile_phase("sounds"):
+                with self._npz_open_tensor(zf, "sounds", (len(mapnames), len(sound_columns), sound_width)) as fd:
+                    for k in mapnames:
+                        block = np.zeros((len(sound_columns), sound_width), dtype=COUNT_DTYPE)
+                        for col, v in sound_stats[k].items():
+                            row = len(sound_columns) - 1 if col == "total" else emitter_codes[col]
+                            block[row, :len(v)] = v
+                        fd.write(block.tobytes())
+
+
+    @staticmethod
+    def _npz_write_array(zf: zipfile.ZipFile, name: str, arr: np.ndarray) -> None:
+        with zf.open(name + ".npy", "w", force_zip64=True) as fd:
+            np.lib.format.write_array(fd, arr, allow_pickle=False)
+
+
+    @staticmethod
+    def _npz_open_tensor(zf: zipfile.ZipFile, name: str, shape: Tuple[int, ...]):
+        """ Opens an npy member of the archive for writing, after writing the header for a COUNT_DTYPE array.
+            The caller writes the data in C order. """
+        fd = zf.open(name + ".npy", "w", force_zip64=True)
+        np.lib.format.write_array_header_1_0(fd, {"descr": np.lib.format.dtype_to_descr(np.dtype(COUNT_DTYPE)),
+                                                  "fortran_order": False, "shape": shape})
+        return fd
+
+
+    def export_stats_to_parquet(self, tile_stats: Dict, sound_stats: Dict, outfile_prefix: str) -> None:
+        """
+        Export the tile and sound statistics of all maps into the Parquet files `<prefix>_tiles.parquet`
+        and `<prefix>_sounds.parquet`. Requires pyarrow.
+        Each file holds one row per map and tile (or sound) with a nonzero total, with the columns
+        `map` (dictionary encoded), `tile` (or `sound`) and one count column per category (or emitter) plus `total`.
+        The tile file also holds one column per extra_input indicator array.
+        The total over all maps is not included. The files can be read with memory mapping and filters on map or tile,
+        e.g. pyarrow.parquet.read_table(path, memory_map=True, filters=[("map", "=", name)]).
+        :param tile_stats: Dictionary containing the collected tile statistics
+        :param sound_stats: Dictionary containing the collected sound statistics
+        :param outfile_prefix: Filename prefix
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        mapnames = [k for k in tile_stats.keys() if k != "total"]
+        for stat_dict, index_col, suffix in ((tile_stats, "tile", "tiles"), (sound_stats, "sound", "sounds")):
+            columns = []
+            for k in mapnames:
+                for col in stat_dict[k].keys():
+                    if col not in columns and col != "total":
+                        columns.append(col)
+            columns.append("total")
+
+            with self.profile_phase("table"):
+                map_codes, indices, counts = [], [], {col: [] for col in columns}
+                for m, k in enumerate(mapnames):
+                    stats = stat_dict[k]
+                    nonzero = stats.nonzero("total")[0] if isinstance(stats, SparseStats) else np.flatnonzero(stats["total"])
+                    map_codes.append(np.full(len(nonzero), m, dtype=np.int32))
+                    indices.append(nonzero.astype(np.int32))
+                    for col in columns:
+                        # all columns of a map have the same length
+                        values = stats[col][nonzero] if col in stats else np.zeros(len(nonzero))
+                        counts[col].append(values.astype(COUNT_DTYPE))
+
+                index = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32)
+                table = {"map": pa.DictionaryArray.from_arrays(np.concatenate(map_codes) if map_codes else np.zeros(0, dtype=np.int32),
+                                                               pa.array(mapnames, type=pa.string())),
+                         index_col: pa.array(index)}
+                for col in columns:
+                    table[col] = pa.array(np.concatenate(counts[col]) if counts[col] else np.zeros(0, dtype=COUNT_DTYPE))
+                if index_col == "tile":
+                    for flag, v in self.extra_tilestats.items():
+                        table[flag] = pa.array(np.asarray(v)[index])
+
+            with self.profile_phase("write"):
+                pq.write_table(pa.table(table), f"{outfile_prefix}_{suffix}.parquet")
+
 
     def output_rejected_stats(self, reject, filename):
         # collect and output rejected lines
@@ -454,57 +2364,324 @@ class MapStatsParser:
             print(f"rejected lines listed in {filename}")
 
 
+def _count_log_chunk(logpath: str, entries: List[LogMapIndex], maxtiles: int, maxsounds: int, skip_overwall0: bool):
+    """
+    Worker of MapStatsParser.parse_log_parallel. Counts the given maps of the log and returns for each map its name,
+    its sparse tile statistics, tile rejects, sound counts and sound rejects.
+    """
+    results = []
+    with open(logpath, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with log_view(mm) as view:
+            for entry in entries:
+                results.append((entry.mapname, *MapStatsParser._count_indexed_map(view, entry, maxtiles, maxsounds, skip_overwall0)))
+    return results
+
+
+def _count_map_chunk(units: List[Tuple[str, Optional[str]]], maxtiles: int, maxsounds: int, skip_overwall0: bool,
+                     sound_rules: Optional[SoundRules]):
+    """
+    Worker of MapStatsParser.parse_map_batch. Counts the given maps, each a MAP file or a member of an archive, and
+    returns for each map its name, sparse tile statistics, tile rejects, sound counts, sound rejects and the error
+    if the map could not be read, in which case the statistics are None.
+    """
+    results = []
+    containers = dict()
+    try:
+        for path, member in units:
+            mapname = path if member is None else f"{path}/{member}"
+            try:
+                if member is None:
+                    source = path
+                else:
+                    if path not in containers:
+                        containers[path] = open_container(path)
+                    source = containers[path].read(member)
+                result = MapStatsParser.count_map(source, maxtiles, maxsounds, skip_overwall0, sound_rules, path=mapname)
+                results.append((mapname, result.tile_stats, result.tile_rejects, result.sound_counts, result.sound_rejects, None))
+            except Exception as ex:
+                results.append((mapname, None, None, None, None, f"{type(ex).__name__}: {ex}"))
+    finally:
+        for container in containers.values():
+            container.close()
+    return results
+
+
+def query_index(index_path: str, kind: str, first: int, last: Optional[int]) -> int:
+    """ Prints the maps that use the given tile or sound numbers, with their counts per category or emitter. """
+    if not os.path.exists(index_path):
+        print(f"ERROR: Index file '{index_path}' does not exist, run asset_parser.py on a log file first!", file=sys.stderr)
+        return 1
+    index = AssetIndex.load(index_path)
+    if first < 0 or first >= index.size(kind):
+        print(f"ERROR: {kind} {first} is outside of the indexed range 0 to {index.size(kind) - 1}", file=sys.stderr)
+        return 1
+
+    entries = index.lookup(kind, first, last)
+    if len(entries) == 0:
+        print(f"No map uses {kind} {first}" + (f" to {last}" if last is not None else ""))
+        return 0
+
+    for num, num_entries in itertools.groupby(entries, key=lambda e: e[0]):
+        num_entries = list(num_entries)
+        per_column = {str(col): 0 for col in index.arrays[f"{kind}_columns"]}
+        for _, _, col, cnt in num_entries:
+            per_column[col] = per_column.get(col, 0) + cnt
+        per_map = [(m, list(g)) for m, g in itertools.groupby(num_entries, key=lambda e: e[1])]
+        summary = ", ".join(f"{col} {cnt}" for col, cnt in per_column.items() if cnt > 0)
+        print(f"{kind} {num}: {sum(per_column.values())} uses in {len(per_map)} maps ({summary})")
+        for mapname, map_entries in per_map:
+            print(f"    {mapname}: " + ", ".join(f"{col} {cnt}" for _, _, col, cnt in map_entries))
+    return 0
+
+
+def follow(parser: MapStatsParser, logpath: str, cargs: dict) -> int:
+    """ Updates the database from the log as it is written, until interrupted. See --follow. """
+    if cargs["--bulk_db"]:
+        parser.start_database(journal_mode="WAL", synchronous="OFF")
+    else:
+        parser.start_database()
+
+    tile_reject, sound_reject = dict(), dict()
+    print(f"following {logpath}, press Ctrl+C to stop")
+    try:
+        for result in parser.follow_log(logpath, poll_interval=float(cargs["--poll"]), normalized=cargs["--normalized"],
+                                        skip_overwall0=True):
+            tile_reject[result.path] = result.tile_rejects
+            sound_reject[result.path] = result.sound_rejects
+            print(f"statistics of {result.path} updated in database at {DBPATH}")
+    except KeyboardInterrupt:
+        print("stopped following the log")
+    finally:
+        parser.close_database()
+
+    parser.output_rejected_stats(tile_reject, "tilestats_reject.txt")
+    parser.output_rejected_stats(sound_reject, "soundstats_reject.txt")
+    if parser.profiler is not None:
+        parser.profiler.info["maps"] = len(tile_reject)
+        parser.profiler.write_report(cargs["--profile"])
+        print(f"profiling report written to {cargs['--profile']}")
+    return 0
+
+
 def main():
     argv = None
     cargs = docopt(__doc__, argv=argv, version=__version__)
 
+    if cargs["query"]:
+        kind = "tile" if cargs["tile"] else "sound"
+        try:
+            first = int(cargs["<first>"])
+            last = int(cargs["<last>"]) if cargs["<last>"] is not None else None
+        except ValueError:
+            print(f"ERROR: {kind} numbers must be integers!", file=sys.stderr)
+            return 1
+        return query_index(cargs["--index"], kind, first, last)
+
     # some basic sanity checks
     mapster32_log_path = cargs["<logfile>"]
-    if not (mapster32_log_path.endswith(".log") and os.path.exists(mapster32_log_path)):
+    if cargs["maps"]:
+        if len(expand_map_paths(cargs["<mapfile>"])) == 0:
+            print("ERROR: No map files or archives found at the given paths!", file=sys.stderr)
+            return 1
+    elif not (mapster32_log_path.endswith(".log") and os.path.exists(mapster32_log_path)):
         print("ERROR: Provided logfile path is invalid!", file=sys.stderr)
         return 1
 
+    if cargs["--follow"] and not cargs["sqlite"]:
+        print("ERROR: --follow only supports sqlite output!", file=sys.stderr)
+        return 1
+
+    if cargs["--cache"] and not (cargs["maps"] or cargs["--mmap"] or cargs["--jobs"]):
+        print("ERROR: --cache is only supported with maps, --mmap or --jobs!", file=sys.stderr)
+        return 1
+
+    if cargs["parquet"] and importlib.util.find_spec("pyarrow") is None:
+        print("ERROR: Parquet output requires pyarrow to be installed!", file=sys.stderr)
+        return 1
+
     print("Extra stats usage enabled.")
     if cargs["--use_extra_stats"]:
-        files = os.listdir("./extra_input")
-        extras = {f[0:-4]: os.path.join("extra_input", f) for f in files if f.endswith(".pkl")}
+        # the indicator store format takes precedence over legacy pickles of the same name
+        files = sorted(os.listdir("./extra_input"), key=lambda f: f.endswith(INDICATOR_EXT))
+        extras = {os.path.splitext(f)[0]: os.path.join("extra_input", f) for f in files
+                  if f.endswith(".pkl") or f.endswith(INDICATOR_EXT)}
     else:
         extras = dict()
 
     max_tilenum = int(cargs["--maxtiles"])
     parser = MapStatsParser(maxtiles=max_tilenum, **extras)
-
-    # parse tile and sound information from log file
-    tpm, spm = parser.parse_log(mapster32_log_path)
-
-    # Aggregate stats for tiles
-    tile_stats, reject = parser.aggregate_tilestats(tpm, maxtiles=max_tilenum, skip_overwall0=True)
-    parser.output_rejected_stats(reject, "tilestats_reject.txt")
-
-    # Aggregate stats for sounds
-    sound_stats, reject = parser.aggregate_soundstats(spm)
-    parser.output_rejected_stats(reject, "soundstats_reject.txt")
+    if cargs["--profile"]:
+        profiler = parser.enable_profiling(trace_allocations=cargs["--tracemalloc"])
+        if cargs["maps"]:
+            profiler.info.update(mapfiles=len(cargs["<mapfile>"]), options={k: v for k, v in cargs.items() if v})
+        else:
+            profiler.info.update(logfile=mapster32_log_path, log_lines=count_log_lines(mapster32_log_path),
+                                 options={k: v for k, v in cargs.items() if v})
+
+    if cargs["--follow"]:
+        return follow(parser, mapster32_log_path, cargs)
+
+    affected, checkpoint = None, None
+    cache = ResultCache(cargs["--cache"], int(float(cargs["--cache_size"]) * 1024 * 1024)) if cargs["--cache"] else None
+    if cargs["maps"]:
+        # read the map files directly, without a log
+        sound_rules = None
+        if os.path.exists(cargs["--names"]):
+            sound_rules = SoundRules.from_names_h(cargs["--names"])
+        else:
+            print(f"WARNING: names.h not found at '{cargs['--names']}', sounds are not counted", file=sys.stderr)
+        with parser.profile_phase("map reading") as counts:
+            tile_stats, tile_reject, sound_stats, sound_reject, failures = \
+                parser.parse_map_batch(cargs["<mapfile>"], maxtiles=max_tilenum, jobs=int(cargs["--jobs"] or 1),
+                                       chunksize=int(cargs["--chunksize"]), skip_overwall0=True, sound_rules=sound_rules,
+                                       cache=cache)
+            counts.update(maps=sum(1 for k in tile_stats if k != "total"))
+        if len(failures) > 0:
+            with open("maps_failed.txt", "w") as fd:
+                for mapname, error in failures.items():
+                    fd.write(f"{mapname}: {error}\n")
+            print(f"{len(failures)} maps could not be read, listed in maps_failed.txt")
+    elif cargs["--checkpoint"]:
+        # only parse the maps that were appended since the last run
+        with parser.profile_phase("log scan and aggregation"):
+            tile_stats, tile_reject, sound_stats, sound_reject, affected, checkpoint = \
+                parser.parse_log_incremental(mapster32_log_path, cargs["--checkpoint"], maxtiles=max_tilenum, skip_overwall0=True)
+    elif cargs["--out_of_core"]:
+        # keep the statistics of each map on disk
+        with parser.profile_phase("log scan and aggregation"):
+            tile_stats, tile_reject, sound_stats, sound_reject = \
+                parser.parse_log_out_of_core(mapster32_log_path, cargs["--out_of_core"], maxtiles=max_tilenum, skip_overwall0=True)
+    elif cargs["--jobs"]:
+        # split the log at map boundaries and count the maps with multiple processes
+        with parser.profile_phase("log scan and aggregation"):
+            tile_stats, tile_reject, sound_stats, sound_reject = \
+                parser.parse_log_parallel(mapster32_log_path, maxtiles=max_tilenum, jobs=int(cargs["--jobs"]), skip_overwall0=True,
+                                          cache=cache)
+    elif cargs["--mmap"]:
+        # scan the memory-mapped log file for map boundaries, then count each map
+        with parser.profile_phase("log scan and aggregation"):
+            tile_stats, tile_reject, sound_stats, sound_reject = \
+                parser.parse_log_mmap(mapster32_log_path, maxtiles=max_tilenum, skip_overwall0=True, cache=cache)
+    elif cargs["--stream"]:
+        # count tiles and sounds while reading the log file
+        with parser.profile_phase("log scan and aggregation"):
+            tile_stats, tile_reject, sound_stats, sound_reject = \
+                parser.parse_log_streaming(mapster32_log_path, maxtiles=max_tilenum, skip_overwall0=True)
+    else:
+        # parse tile and sound information from log file
+        with parser.profile_phase("log scan"):
+            tpm, spm = parser.parse_log(mapster32_log_path)
+
+        # Aggregate stats for tiles
+        with parser.profile_phase("tile aggregation") as counts:
+            tile_stats, tile_reject = parser.aggregate_tilestats(tpm, maxtiles=max_tilenum, skip_overwall0=True)
+            counts.update(lines=sum(map(len, tpm.values())), maps=len(tpm))
+
+        # Aggregate stats for sounds
+        with parser.profile_phase("sound aggregation") as counts:
+            sound_stats, sound_reject = parser.aggregate_soundstats(spm)
+            counts.update(lines=sum(map(len, spm.values())), maps=len(spm))
+
+    if cache is not None:
+        cache.close()
+        print(f"result cache: {cache.hits} maps reused, {cache.misses} maps not found in {cargs['--cache']}")
+
+    if parser.profiler is not None:
+        # "total" is only added if there is more than one map
+        num_maps = sum(1 for k in tile_stats if k != "total")
+        # the log scan covers every line of the log
+        parser.profiler.info["maps"] = num_maps
+        for name in ("log scan", "log scan and aggregation"):
+            if name in parser.profiler.phases:
+                parser.profiler.phases[name].update(lines=parser.profiler.info["log_lines"], maps=num_maps)
+
+    with parser.profile_phase("rejects output"):
+        parser.output_rejected_stats(tile_reject, "tilestats_reject.txt")
+        parser.output_rejected_stats(sound_reject, "soundstats_reject.txt")
+
+    # the index always covers all maps, including those unchanged since the checkpoint
+    with parser.profile_phase("index"):
+        AssetIndex.build(tile_stats, sound_stats, max_tilenum).save(cargs["--index"])
+    print(f"tile and sound index written to {cargs['--index']}")
+
+    if affected is not None and (cargs["sqlite"] or cargs["csv"]):
+        # only rewrite the outputs of the maps that changed, plus the totals
+        print(f"{len(affected)} maps updated since the last run")
+        tile_stats = {k: v for k, v in tile_stats.items() if k in affected or k == "total"}
+        sound_stats = {k: v for k, v in sound_stats.items() if k in affected or k == "total"}
 
     if cargs["sqlite"]:
-        parser.start_database()
-        parser.export_tiles_to_sqlite(tile_stats)
-        print(f"tile statistics written to database at {DBPATH}")
-        parser.export_sounds_to_sqlite(sound_stats)
-        print(f"sound statistics written to database at {DBPATH}")
-        parser.close_database()
+        if cargs["--bulk_db"]:
+            parser.start_database(journal_mode="WAL", synchronous="OFF")
+        else:
+            parser.start_database()
+        if cargs["--normalized"]:
+            with parser.profile_phase("normalized sqlite export") as counts:
+                parser.export_to_normalized_sqlite(tile_stats, sound_stats)
+                counts.update(maps=len(tile_stats))
+            print(f"tile and sound statistics written to normalized tables in database at {DBPATH}")
+        else:
+            with parser.profile_phase("tile sqlite export") as counts:
+                parser.export_tiles_to_sqlite(tile_stats)
+                counts.update(maps=len(tile_stats))
+            print(f"tile statistics written to database at {DBPATH}")
+            with parser.profile_phase("sound sqlite export") as counts:
+                parser.export_sounds_to_sqlite(sound_stats)
+                counts.update(maps=len(sound_stats))
+            print(f"sound statistics written to database at {DBPATH}")
+        with parser.profile_phase("sqlite commit"):
+            parser.close_database()
+    elif cargs["xlsx"] and (cargs["--constant_memory"] or cargs["--nonzero_rows"]):
+        with parser.profile_phase("tile xlsx export") as counts:
+            parser.export_stats_to_excel_streaming(tile_stats, "tile_usage_stats", insert_extras=cargs["--use_extra_stats"],
+                                                   nonzero_rows=cargs["--nonzero_rows"])
+            counts.update(maps=len(tile_stats))
+        print(f"tile statistics written to xlsx file at tile_usage_stats.xlsx")
+        with parser.profile_phase("sound xlsx export") as counts:
+            parser.export_stats_to_excel_streaming(sound_stats, "sound_usage_stats", insert_extras=False,
+                                                   nonzero_rows=cargs["--nonzero_rows"])
+            counts.update(maps=len(sound_stats))
+        print(f"sound statistics written to xlsx file at sound_usage_stats.xlsx")
     elif cargs["xlsx"]:
-        parser.export_stats_to_excel(tile_stats, "tile_usage_stats", insert_extras=cargs["--use_extra_stats"])
+        with parser.profile_phase("tile xlsx export") as counts:
+            parser.export_stats_to_excel(tile_stats, "tile_usage_stats", insert_extras=cargs["--use_extra_stats"])
+            counts.update(maps=len(tile_stats))
         print(f"sound statistics written to xlsx file at tile_usage_stats.xlsx")
-        parser.export_stats_to_excel(sound_stats, "sound_usage_stats", insert_extras=False)
+        with parser.profile_phase("sound xlsx export") as counts:
+            parser.export_stats_to_excel(sound_stats, "sound_usage_stats", insert_extras=False)
+            counts.update(maps=len(sound_stats))
         print(f"sound statistics written to xlsx file at sound_usage_stats.xlsx")
     elif cargs["csv"]:
-        parser.export_stats_to_csv(tile_stats, "tilestats", insert_extras=cargs["--use_extra_stats"])
+        with parser.profile_phase("tile csv export") as counts:
+            parser.export_stats_to_csv(tile_stats, "tilestats", insert_extras=cargs["--use_extra_stats"])
+            counts.update(maps=len(tile_stats))
         print(f"sound statistics written to csv files in the folder './tilestats'")
-        parser.export_stats_to_csv(sound_stats, "soundstats", insert_extras=False)
+        with parser.profile_phase("sound csv export") as counts:
+            parser.export_stats_to_csv(sound_stats, "soundstats", insert_extras=False)
+            counts.update(maps=len(sound_stats))
         print(f"sound statistics written to csv files in the folder './soundstats'")
+    elif cargs["npz"]:
+        with parser.profile_phase("npz export") as counts:
+            parser.export_stats_to_npz(tile_stats, sound_stats, NPZ_PATH)
+            counts.update(maps=len(tile_stats))
+        print(f"tile and sound statistics written to npz file at {NPZ_PATH}")
+    elif cargs["parquet"]:
+        with parser.profile_phase("parquet export") as counts:
+            parser.export_stats_to_parquet(tile_stats, sound_stats, "asset_stats")
+            counts.update(maps=len(tile_stats))
+        print(f"tile and sound statistics written to asset_stats_tiles.parquet and asset_stats_sounds.parquet")
     else:
         raise ValueError("unsupported format for exporting statistics")
 
+    if checkpoint is not None:
+        with parser.profile_phase("checkpoint"):
+            parser.save_checkpoint(cargs["--checkpoint"], checkpoint)
+        print(f"checkpoint written to {cargs['--checkpoint']}")
+
+    if parser.profiler is not None:
+        parser.profiler.write_report(cargs["--profile"])
+        print(f"profiling report written to {cargs['--profile']}")
+
     return 0
 
 
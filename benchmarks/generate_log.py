@@ -0,0 +1,170 @@
+#!/bin/python3
+# Author: Dino Bollinger
+# Licensed under BSD 3-Clause License, see included LICENSE file
+""" Synthetic Mapster32 Log Generator
+Writes a mapster32.log in the verbose output format of `dump_used_assets.m32` (see format_reference.txt),
+for benchmarking the asset parser without requiring a collection of real maps.
+The output only depends on the given options, the same seed always produces the same log.
+The number of sprites, walls and sectors of each map is drawn uniformly between half and 1.5 times the given count.
+With --map_dir, a Build MAP file with the same picnums is written for each map, named as in the log,
+such that map_reader.py can be compared with the log parser. The geometry of these maps is not meaningful.
+------------------------------------------------------------------------------------------
+Usage: generate_log.py <outfile> [--maps <maps>] [--sprites <sprites>] [--walls <walls>] [--sectors <sectors>] [--sounds <sounds>] [--corrupt <rate>] [--invalid <rate>] [--maxtiles <max_tiles>] [--seed <seed>] [--map_dir <dir>]
+       generate_log.py --help -h
+Required Arguments:
+    outfile                     Path of the log file to write.
+Options:
+    --maps <maps>               Number of maps in the log. [default: 100]
+    --sprites <sprites>         Average number of sprites per map. [default: 1500]
+    --walls <walls>             Average number of walls per map. [default: 6000]
+    --sectors <sectors>         Average number of sectors per map. [default: 800]
+    --sounds <sounds>           Average number of sound lines per map. [default: 60]
+    --corrupt <rate>            Fraction of maps whose load line reports corruption or removed sprites. [default: 0.05]
+    --invalid <rate>            Fraction of picnums and sound numbers that are negative or out of range. [default: 0.001]
+    --maxtiles <max_tiles>      Valid picnums are below this number. [default: 8192]
+    --seed <seed>               Seed of the random number generator. [default: 0]
+    --map_dir <dir>             Also write a MAP file for each map into this directory, which must exist.
+"""
+
+import sys
+import os
+
+import numpy as np
+
+from typing import List, TextIO, Optional
+
+from docopt import docopt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from map_reader import HEADER_DTYPE, SECTOR_DTYPE, WALL_DTYPE, SPRITE_DTYPE, map_limits
+
+MAXSOUNDS = 16384
+
+# load line variants, as matched by mapload_pattern in asset_parser.py
+corruption_variants = ["(EXTREME corruption)", "(HEAVY corruption)", "(moderate corruption)", "(removed {} sprites)"]
+
+# sound emitters in the order they are searched by dump_used_assets.m32
+sound_emitters = ["MUSICANDSFX triggered", "MUSICANDSFX ambient", "sector one-time", "MIKE",
+                  "switch", "MIRROR", "sector 65534", "doortile"]
+
+# mapster32 writes other output between the map searches
+filler_lines = ["Mapster32 r9000\n", "Using DEF file \"duke3d.def\".\n", "Loading art files...\n"]
+
+
+def draw_indices(rng: np.random.Generator, n: int, maxnum: int, invalid: float) -> np.ndarray:
+    """
+    Draws n picnums or sound numbers. Low numbers are more common, as is the case for real maps.
+    :param rng: Random number generator
+    :param n: Number of indices to draw
+    :param maxnum: Indices below this number are valid
+    :param invalid: Fraction of indices that are replaced with negative or out of range values
+    :return: Integer array of length n
+    """
+    indices = np.minimum(rng.zipf(1.3, n) - 1 + rng.integers(0, 16, n) * (rng.random(n) < 0.5), maxnum - 1)
+    bad = rng.random(n) < invalid
+    indices[bad] = rng.choice([-1, maxnum, maxnum + 1000], int(bad.sum()))
+    return indices
+
+
+def write_map(path: str, version: int, sprite_picnums: List[int], sector_picnums: List[int], wall_picnums: List[int]) -> None:
+    """
+    Writes a MAP file with the given picnums. Each sector gets a consecutive range of walls, which form a loop,
+    and the sprites are distributed over the sectors.
+    :param path: Output file path
+    :param version: map version, raised if the map exceeds its limits
+    :param sprite_picnums: picnum of each sprite
+    :param sector_picnums: floor and ceiling picnum of each sector, interleaved
+    :param wall_picnums: picnum and overpicnum of each wall, interleaved
+    """
+    sectors = np.zeros(len(sector_picnums) // 2, dtype=SECTOR_DTYPE)
+    walls = np.zeros(len(wall_picnums) // 2, dtype=WALL_DTYPE)
+    sprites = np.zeros(len(sprite_picnums), dtype=SPRITE_DTYPE)
+    while any(n > limit for n, limit in zip((len(sectors), len(walls), len(sprites)), map_limits[version])):
+        version += 1
+
+    sectors["floorpicnum"], sectors["ceilingpicnum"] = sector_picnums[0::2], sector_picnums[1::2]
+    walls["picnum"], walls["overpicnum"] = wall_picnums[0::2], wall_picnums[1::2]
+    walls["nextwall"], walls["nextsector"] = -1, -1
+    bounds = np.linspace(0, len(walls), len(sectors) + 1).astype(np.int64)
+    sectors["wallptr"], sectors["wallnum"] = bounds[:-1], np.diff(bounds)
+    point2 = np.arange(1, len(walls) + 1)
+    point2[bounds[1:] - 1] = bounds[:-1]
+    walls["point2"] = point2
+    sprites["picnum"] = sprite_picnums
+    sprites["sectnum"] = np.arange(len(sprites)) % max(len(sectors), 1)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["version"] = version
+    with open(path, "wb") as fd:
+        fd.write(header.tobytes())
+        for arr in (sectors, walls, sprites):
+            fd.write(len(arr).to_bytes(2, "little"))
+            fd.write(arr.tobytes())
+
+
+def map_lines(rng: np.random.Generator, mapnum: int, sprites: int, walls: int, sectors: int, sounds: int,
+              corrupt: float, invalid: float, maxtiles: int, map_dir: Optional[str] = None) -> str:
+    """ Produces the load line and the tile and sound search output for a single map, and writes its MAP file to map_dir. """
+    if rng.random() < corrupt:
+        status = corruption_variants[rng.integers(len(corruption_variants))].format(rng.integers(1, 100))
+    else:
+        status = "successfully"
+    version = int(rng.integers(7, 10))
+    out = [f"Loaded V{version} map usermaps/map{mapnum:05d}.map {status}\n",
+           "Searching for tiles used in current map...\n"]
+
+    nsprites, nwalls, nsectors = (int(rng.integers(c // 2, c + c // 2 + 1)) for c in (sprites, walls, sectors))
+
+    # sprites first, then floor and ceiling per sector, then wall and overwall per wall
+    sprite_picnums = draw_indices(rng, nsprites, maxtiles, invalid).tolist()
+    out.extend(f"sprite,{t},\n" for t in sprite_picnums)
+    sector_picnums = draw_indices(rng, 2 * nsectors, maxtiles, invalid).tolist()
+    out.extend(f"floor,{f},\nceiling,{c},\n" for f, c in zip(sector_picnums[0::2], sector_picnums[1::2]))
+    wall_picnums = draw_indices(rng, 2 * nwalls, maxtiles, invalid)
+    wall_picnums[1::2][rng.random(nwalls) < 0.8] = 0
+    wall_picnums = wall_picnums.tolist()
+    out.extend(f"wall,{w},\noverwall,{o},\n" for w, o in zip(wall_picnums[0::2], wall_picnums[1::2]))
+    out.append("Tile search finished.\n")
+
+    out.append("Searching for sounds used in current map...\n")
+    nsounds = int(rng.integers(sounds // 2, sounds + sounds // 2 + 1))
+    emitters = np.sort(rng.integers(0, len(sound_emitters), nsounds))
+    sound_nums = draw_indices(rng, nsounds, MAXSOUNDS, invalid).tolist()
+    out.extend(f"{sound_emitters[e]},{s},\n" for e, s in zip(emitters.tolist(), sound_nums))
+    out.append("Sound search finished.\n")
+    out.append("Search finished.\n")
+
+    if map_dir is not None:
+        write_map(os.path.join(map_dir, f"map{mapnum:05d}.map"), version, sprite_picnums, sector_picnums, wall_picnums)
+    return "".join(out)
+
+
+def generate_log(fd: TextIO, maps: int, sprites: int, walls: int, sectors: int, sounds: int,
+                 corrupt: float = 0.0, invalid: float = 0.0, maxtiles: int = 8192, seed: int = 0,
+                 map_dir: Optional[str] = None) -> None:
+    """
+    Writes a synthetic log with the given number of maps to the text stream.
+    See the module documentation for a description of the parameters.
+    """
+    rng = np.random.default_rng(seed)
+    fd.writelines(filler_lines)
+    for m in range(maps):
+        fd.write(map_lines(rng, m, sprites, walls, sectors, sounds, corrupt, invalid, maxtiles, map_dir))
+        if rng.random() < 0.1:
+            fd.write(filler_lines[rng.integers(len(filler_lines))])
+
+
+def main():
+    cargs = docopt(__doc__)
+    with open(cargs["<outfile>"], "w") as fd:
+        generate_log(fd, maps=int(cargs["--maps"]), sprites=int(cargs["--sprites"]), walls=int(cargs["--walls"]),
+                     sectors=int(cargs["--sectors"]), sounds=int(cargs["--sounds"]),
+                     corrupt=float(cargs["--corrupt"]), invalid=float(cargs["--invalid"]),
+                     maxtiles=int(cargs["--maxtiles"]), seed=int(cargs["--seed"]), map_dir=cargs["--map_dir"])
+    print(f"synthetic log written to {cargs['<outfile>']}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    exit(exit_code)
@@ -0,0 +1,188 @@
+#!/bin/python3
+# Author: Dino Bollinger
+# Licensed under BSD 3-Clause License, see included LICENSE file
+""" Asset Parser Benchmarks
+Runs the stages of asset_parser.py on a synthetic log (see generate_log.py) or on the given log file,
+and reports the duration, throughput in lines/s and maps/s, and the peak resident set size of each stage.
+All output files are written into a temporary directory, which is removed afterwards.
+On Linux, the peak RSS is reset before every stage. On other platforms, it is the peak of the whole process so far.
+------------------------------------------------------------------------------------------
+Usage: run_benchmarks.py [<logfile>] [--maps <maps>] [--sprites <sprites>] [--walls <walls>] [--sectors <sectors>] [--seed <seed>] [--maxtiles <max_tiles>] [--stages <stages>] [--json <file>]
+       run_benchmarks.py --help -h
+Arguments:
+    logfile                     Benchmark this log file instead of a synthetic one.
+Options:
+    --maps <maps>               Number of maps of the synthetic log. [default: 100]
+    --sprites <sprites>         Average number of sprites per map of the synthetic log. [default: 1500]
+    --walls <walls>             Average number of walls per map of the synthetic log. [default: 6000]
+    --sectors <sectors>         Average number of sectors per map of the synthetic log. [default: 800]
+    --seed <seed>               Seed of the synthetic log. [default: 0]
+    --maxtiles <max_tiles>      Defines the maximum expected tilenum. [default: 8192]
+    --stages <stages>           Comma separated list of stages to run. [default: parse_log,aggregate_tilestats,aggregate_soundstats,sqlite,xlsx,xlsx_stream,csv]
+    --json <file>               Also write the results to this JSON file, to compare them across releases.
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import shutil
+import platform
+import tempfile
+import contextlib
+
+import numpy as np
+
+from typing import Callable, Dict, List
+
+from docopt import docopt
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import asset_parser
+from generate_log import generate_log
+
+all_stages = ["parse_log", "aggregate_tilestats", "aggregate_soundstats", "sqlite", "xlsx", "xlsx_stream", "csv"]
+
+
+def run_stage(name: str, func: Callable, lines: int, maps: int) -> Dict:
+    """ Runs a single stage with its console output suppressed, and measures it. """
+    rss_reset = asset_parser.reset_peak_rss()
+    error = None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            func()
+    except Exception as ex:
+        error = f"{type(ex).__name__}: {ex}"
+    seconds = time.perf_counter() - start
+    return {"stage": name, "seconds": seconds, "lines_per_s": lines / seconds, "maps_per_s": maps / seconds,
+            "peak_rss_mb": asset_parser.peak_rss_mb(), "peak_rss_reset": rss_reset, "error": error}
+
+
+def run_benchmarks(logpath: str, maxtiles: int, stages: List[str]) -> List[Dict]:
+    """
+    Runs the given stages on the log, in the current working directory.
+    Stages that depend on the results of others are run in order, but only the requested ones are reported.
+    :param logpath: Mapster32 log file
+    :param maxtiles: Maximum expected tilenum
+    :param stages: Names of the stages to report, out of all_stages
+    :return: List of measurements, one per stage
+    """
+    lines = asset_parser.count_log_lines(logpath)
+
+    parser = asset_parser.MapStatsParser(maxtiles=maxtiles)
+    state = dict()
+
+    def parse():
+        state["tpm"], state["spm"] = parser.parse_log(logpath)
+
+    def tiles():
+        state["tile_stats"], _ = parser.aggregate_tilestats(state["tpm"], maxtiles=maxtiles, skip_overwall0=True)
+
+    def sounds():
+        state["sound_stats"], _ = parser.aggregate_soundstats(state["spm"])
+
+    def sqlite():
+        parser.start_database()
+        parser.export_tiles_to_sqlite(state["tile_stats"])
+        parser.export_sounds_to_sqlite(state["sound_stats"])
+        parser.close_database()
+
+    def xlsx():
+        parser.export_stats_to_excel(state["tile_stats"], "tile_usage_stats")
+        parser.export_stats_to_excel(state["sound_stats"], "sound_usage_stats")
+
+    def xlsx_stream():
+        parser.export_stats_to_excel_streaming(state["tile_stats"], "tile_usage_stats")
+        parser.export_stats_to_excel_streaming(state["sound_stats"], "sound_usage_stats")
+
+    def csv():
+        parser.export_stats_to_csv(state["tile_stats"], "tilestats")
+        parser.export_stats_to_csv(state["sound_stats"], "soundstats")
+
+    funcs = {"parse_log": parse, "aggregate_tilestats": tiles, "aggregate_soundstats": sounds,
+             "sqlite": sqlite, "xlsx": xlsx, "xlsx_stream": xlsx_stream, "csv": csv}
+    needed = set(stages)
+    if needed & {"sqlite", "xlsx", "xlsx_stream", "csv"}:
+        needed |= {"aggregate_tilestats", "aggregate_soundstats"}
+    if needed:
+        needed.add("parse_log")
+
+    results = []
+    maps = 0
+    for name in all_stages:
+        if name not in needed:
+            continue
+        result = run_stage(name, funcs[name], lines, maps)
+        if name == "parse_log":
+            maps = len(state.get("tpm", ()))
+            result["maps_per_s"] = maps / result["seconds"]
+        if name in stages:
+            results.append(result)
+        if result["error"] is not None and name in ("parse_log", "aggregate_tilestats", "aggregate_soundstats"):
+            print(f"ERROR: Stage {name} failed, cannot run the remaining stages: {result['error']}", file=sys.stderr)
+            break
+    return results
+
+
+def main():
+    cargs = docopt(__doc__)
+    stages = [s.strip() for s in cargs["--stages"].split(",") if s.strip()]
+    for s in stages:
+        if s not in all_stages:
+            print(f"ERROR: Unknown stage '{s}', expected one of {', '.join(all_stages)}", file=sys.stderr)
+            return 1
+
+    maxtiles = int(cargs["--maxtiles"])
+    workdir = tempfile.mkdtemp(prefix="asset_parser_bench_")
+    prev_dir = os.getcwd()
+    try:
+        if cargs["<logfile>"]:
+            logpath = os.path.abspath(cargs["<logfile>"])
+            setup = {"logfile": logpath}
+        else:
+            logpath = os.path.join(workdir, "mapster32.log")
+            setup = {"maps": int(cargs["--maps"]), "sprites": int(cargs["--sprites"]), "walls": int(cargs["--walls"]),
+                     "sectors": int(cargs["--sectors"]), "seed": int(cargs["--seed"])}
+            print("generating synthetic log...")
+            with open(logpath, "w") as fd:
+                generate_log(fd, sounds=60, corrupt=0.05, invalid=0.001, maxtiles=maxtiles, **setup)
+
+        # the exporters write relative to the working directory, and expect the schemas in ./databases
+        shutil.copytree(os.path.join(REPO_DIR, "databases"), os.path.join(workdir, "databases"),
+                        ignore=shutil.ignore_patterns("*.sqlite"))
+        os.chdir(workdir)
+        results = run_benchmarks(logpath, maxtiles, stages)
+    finally:
+        os.chdir(prev_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'stage':<22}{'seconds':>10}{'lines/s':>14}{'maps/s':>10}{'peak RSS':>12}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:>9.1f} MiB" if r["peak_rss_mb"] is not None else f"{'n/a':>12}"
+        print(f"{r['stage']:<22}{r['seconds']:>10.3f}{r['lines_per_s']:>14,.0f}{r['maps_per_s']:>10.1f}{rss}")
+        if r["error"] is not None:
+            print(f"    failed with {r['error']}")
+
+    if cargs["--json"]:
+        try:
+            import pandas
+            pandas_version = pandas.__version__
+        except ImportError:
+            pandas_version = None
+        report = {"asset_parser_version": asset_parser.__version__, "python": platform.python_version(),
+                  "numpy": np.__version__, "pandas": pandas_version, "platform": platform.platform(),
+                  "maxtiles": maxtiles, "setup": setup, "results": results}
+        with open(cargs["--json"], "w") as fd:
+            json.dump(report, fd, indent=2)
+        print(f"results written to {cargs['--json']}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    exit(exit_code)
@@ -0,0 +1,278 @@
+#!/bin/python3
+# Author: Dino Bollinger
+# Licensed under BSD 3-Clause License, see included LICENSE file
+""" Container Reader
+Reads the files stored in GRP archives of the Build engine and in ZIP archives (including PK3 user map packs),
+without extracting them to disk. GRP archives and the stored members of ZIP archives are memory-mapped, and
+their members are returned as zero-copy views into the mapping. Compressed ZIP members are decompressed in memory.
+
+GRP layout, all values little endian:
+    "KenSilverman", uint32 numfiles
+    numfiles directory entries: 12 byte file name padded with NUL bytes, uint32 size
+    the contents of the files, in the order of the directory
+
+ART files found in a container can be opened with ArtFile, which exposes the tile sizes and animation
+flags of the tiles defined in the file as arrays over the buffer.
+------------------------------------------------------------------------------------------
+Usage: containers.py <archive> [<ext>]
+    Lists the directory of a GRP or ZIP archive, optionally only the members with the given extension.
+"""
+
+import sys
+import os
+import glob
+import mmap
+import struct
+import zipfile
+
+import numpy as np
+
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+GRP_MAGIC = b"KenSilverman"
+
+MAP_EXT = ".map"
+ART_EXT = ".art"
+
+# extensions of the archives picked up when searching directories for maps
+ARCHIVE_EXTS = (".grp", ".zip", ".pk3")
+
+
+class ContainerEntry(NamedTuple):
+    """ Directory entry of a container. The offset is that of the member data in the archive file. """
+    name: str
+    offset: int
+    size: int
+    compressed_size: int
+    stored: bool
+
+
+def is_container(path: str) -> bool:
+    """ Whether the file is a GRP or ZIP archive, decided by its contents rather than its extension. """
+    with open(path, "rb") as fd:
+        magic = fd.read(len(GRP_MAGIC))
+    return magic == GRP_MAGIC or zipfile.is_zipfile(path)
+
+
+class Container:
+    """
+    Read-only view of the members of a GRP or ZIP archive. Use open_container to open an archive of either type.
+    Member names are looked up case-insensitively, as by the Build engine. The buffers returned by `read` share
+    the memory mapping of the archive, and should be released before the container is closed.
+    """
+
+    def __init__(self, path: str, entries: List[ContainerEntry]):
+        self.path = path
+        self.entries: Dict[str, ContainerEntry] = {e.name: e for e in entries}
+        self._lookup: Dict[str, str] = {e.name.upper(): e.name for e in entries}
+        with open(path, "rb") as fd:
+            self._mmap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def names(self, ext: Optional[str] = None) -> List[str]:
+        """ Names of the members in directory order, optionally only those with the given extension. """
+        return [n for n in self.entries if ext is None or n.lower().endswith(ext)]
+
+    def maps(self) -> List[str]:
+        return self.names(MAP_EXT)
+
+    def art_files(self) -> List[str]:
+        return self.names(ART_EXT)
+
+    def entry(self, name: str) -> ContainerEntry:
+        key = self._lookup.get(name.upper())
+        if key is None:
+            raise KeyError(f"'{name}' not found in '{self.path}'")
+        return self.entries[key]
+
+    def read(self, name: str) -> Union[memoryview, bytes]:
+        """
+        Returns the contents of a member. Stored members are returned as a memoryview of the archive mapping.
+        :param name: member name, case-insensitive
+        :return: bytes-like object with the contents of the member
+        """
+        e = self.entry(name)
+        if e.stored:
+            if e.size == 0:
+                return b""
+            return memoryview(self._mmap)[e.offset:e.offset + e.size]
+        return self._read_compressed(e)
+
+    def _read_compressed(self, e: ContainerEntry) -> bytes:
+        raise ValueError(f"'{e.name}' of '{self.path}' is compressed, which {type(self).__name__} does not support")
+
+    def __iter__(self) -> Iterator[Tuple[str, Union[memoryview, bytes]]]:
+        """ Yields the name and contents of each member. """
+        for name in self.entries:
+            yield name, self.read(name)
+
+    def __contains__(self, name) -> bool:
+        return name.upper() in self._lookup
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # a member is still in use, the mapping is closed once it is released
+                pass
+            self._mmap = None
+
+    def __enter__(self) -> "Container":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class GrpFile(Container):
+    """ Build engine GRP archive. All members are stored uncompressed. """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as fd:
+            header = fd.read(len(GRP_MAGIC) + 4)
+            if len(header) < len(GRP_MAGIC) + 4 or header[:len(GRP_MAGIC)] != GRP_MAGIC:
+                raise ValueError(f"'{path}' is not a GRP file")
+            numfiles = struct.unpack_from("<I", header, len(GRP_MAGIC))[0]
+            directory = fd.read(numfiles * 16)
+            filesize = os.fstat(fd.fileno()).st_size
+        if len(directory) < numfiles * 16:
+            raise ValueError(f"GRP file '{path}' is truncated, expected {numfiles} directory entries")
+
+        entries = []
+        offset = len(header) + len(directory)
+        for i in range(numfiles):
+            name = directory[i * 16:i * 16 + 12].split(b"\x00", 1)[0].decode("ascii", errors="replace")
+            size = struct.unpack_from("<I", directory, i * 16 + 12)[0]
+            entries.append(ContainerEntry(name, offset, size, size, True))
+            offset += size
+        if offset > filesize:
+            raise ValueError(f"GRP file '{path}' is truncated, expected {offset} bytes but found {filesize}")
+        super().__init__(path, entries)
+
+
+class ZipContainer(Container):
+    """ ZIP archive. Stored members are memory-mapped, compressed members are decompressed in memory. """
+
+    def __init__(self, path: str):
+        self._zf = zipfile.ZipFile(path)
+        entries = []
+        with open(path, "rb") as fd:
+            for info in self._zf.infolist():
+                if info.is_dir():
+                    continue
+                # skip the local file header, whose extra field may differ from the central directory
+                fd.seek(info.header_offset + 26)
+                name_len, extra_len = struct.unpack("<HH", fd.read(4))
+                offset = info.header_offset + 30 + name_len + extra_len
+                entries.append(ContainerEntry(info.filename, offset, info.file_size, info.compress_size,
+                                              info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1))
+        super().__init__(path, entries)
+
+    def _read_compressed(self, e: ContainerEntry) -> bytes:
+        return self._zf.read(e.name)
+
+    def close(self) -> None:
+        super().close()
+        self._zf.close()
+
+
+def open_container(path: str) -> Container:
+    """ Opens a GRP or ZIP archive, depending on its contents. """
+    with open(path, "rb") as fd:
+        magic = fd.read(len(GRP_MAGIC))
+    if magic == GRP_MAGIC:
+        return GrpFile(path)
+    elif zipfile.is_zipfile(path):
+        return ZipContainer(path)
+    raise ValueError(f"'{path}' is neither a GRP nor a ZIP archive")
+
+
+def expand_map_paths(patterns: List[str]) -> List[str]:
+    """
+    Expands directories and glob patterns into the MAP files and archives they contain. Directories are searched
+    recursively, and `**` in patterns matches any number of directories. Files given explicitly are always included.
+    :param patterns: paths of files and directories, or glob patterns
+    :return: sorted paths of each pattern, in the order of the patterns and without duplicates
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isfile(pattern):
+            paths.append(pattern)
+            continue
+        elif os.path.isdir(pattern):
+            found = [os.path.join(root, f) for root, _, files in os.walk(pattern) for f in files]
+        else:
+            found = [p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p)]
+        paths.extend(sorted(p for p in found if p.lower().endswith((MAP_EXT,) + ARCHIVE_EXTS)))
+    return list(dict.fromkeys(paths))
+
+
+def iter_map_sources(paths: List[str]) -> Iterator[Tuple[str, Union[str, memoryview, bytes]]]:
+    """
+    Yields the maps of the given paths, expanding archives into the maps they contain.
+    Maps in archives are named `<archive path>/<member name>`, as if the archive was a directory.
+    :param paths: paths of MAP files and of GRP or ZIP archives
+    :return: Iterator of (map name, source), where the source is either a file path or the contents of the map
+    """
+    for path in paths:
+        if not is_container(path):
+            yield path, path
+            continue
+        with open_container(path) as container:
+            for name in container.maps():
+                buf = container.read(name)
+                yield f"{path}/{name}", buf
+                if isinstance(buf, memoryview):
+                    buf.release()
+
+
+class ArtFile:
+    """
+    Header of an ART file, with the per-tile arrays as views into the buffer it was read from.
+    The pixel data of each tile starts at `data_offsets[i]`, and has sizex[i] * sizey[i] bytes in column-major order.
+    """
+    __slots__ = ("tilestart", "tileend", "sizex", "sizey", "picanm", "data_offsets")
+
+    def __init__(self, buf: Union[bytes, bytearray, memoryview], name: str = "<buffer>"):
+        buf = memoryview(buf).cast("B")
+        if len(buf) < 16:
+            raise ValueError(f"ART file '{name}' is truncated")
+        version, _, self.tilestart, self.tileend = struct.unpack_from("<iiii", buf, 0)
+        if version != 1 or self.tileend < self.tilestart:
+            raise ValueError(f"'{name}' is not an ART file")
+        count = self.tileend - self.tilestart + 1
+        if len(buf) < 16 + count * 8:
+            raise ValueError(f"ART file '{name}' is truncated")
+        self.sizex = np.frombuffer(buf, dtype="<i2", count=count, offset=16)
+        self.sizey = np.frombuffer(buf, dtype="<i2", count=count, offset=16 + count * 2)
+        self.picanm = np.frombuffer(buf, dtype="<u4", count=count, offset=16 + count * 4)
+        sizes = self.sizex.astype(np.int64) * self.sizey.astype(np.int64)
+        self.data_offsets = 16 + count * 8 + np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    @property
+    def tiles(self) -> np.ndarray:
+        """ Tile numbers defined by the file. """
+        return np.arange(self.tilestart, self.tileend + 1)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: containers.py <archive> [<ext>]", file=sys.stderr)
+        return 1
+    ext = sys.argv[2].lower() if len(sys.argv) >= 3 else None
+    if ext is not None and not ext.startswith("."):
+        ext = "." + ext
+    with open_container(sys.argv[1]) as container:
+        print(f"{'name':<40}{'size':>12}{'packed':>12}  stored")
+        for name in container.names(ext):
+            e = container.entries[name]
+            print(f"{name:<40}{e.size:>12}{e.compressed_size:>12}  {'yes' if e.stored else 'no'}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    exit(exit_code)
@@ -0,0 +1,36 @@
+CREATE TABLE IF NOT EXISTS maps (
+    id INTEGER PRIMARY KEY,     -- map id, referenced by the usage tables
+    path TEXT UNIQUE NOT NULL,  -- map path as reported in the log
+    name TEXT NOT NULL          -- map filename without directory and extension
+);
+
+CREATE TABLE IF NOT EXISTS tile_usage (
+    map_id INTEGER NOT NULL REFERENCES maps (id),
+    tile SMALLINT NOT NULL,     -- tilenum
+    category TEXT NOT NULL,     -- one of sprite, floor, ceiling, wall, overwall
+    count INTEGER NOT NULL,     -- number of instances, only nonzero counts are stored
+    PRIMARY KEY (map_id, category, tile)
+) WITHOUT ROWID;
+
+-- covering index for lookups by tile, e.g. which maps use tile 1405
+CREATE INDEX IF NOT EXISTS tile_usage_by_tile ON tile_usage (tile, map_id, category, count);
+
+CREATE TABLE IF NOT EXISTS sound_usage (
+    map_id INTEGER NOT NULL REFERENCES maps (id),
+    sound SMALLINT NOT NULL,    -- sound id
+    emitter TEXT NOT NULL,      -- emitter type as reported by dump_used_assets.m32
+    count INTEGER NOT NULL,     -- number of instances, only nonzero counts are stored
+    PRIMARY KEY (map_id, emitter, sound)
+) WITHOUT ROWID;
+
+-- covering index for lookups by sound
+CREATE INDEX IF NOT EXISTS sound_usage_by_sound ON sound_usage (sound, map_id, emitter, count);
+
+CREATE TABLE IF NOT EXISTS tile_flags (
+    flag TEXT NOT NULL,         -- name of the extra_input indicator array, e.g. hardcoded
+    tile SMALLINT NOT NULL,     -- tilenum
+    value INTEGER NOT NULL,     -- indicator value, only nonzero values are stored
+    PRIMARY KEY (flag, tile)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS tile_flags_by_tile ON tile_flags (tile, flag, value);
@@ -4,16 +4,18 @@
 """
 This (more or less primitive) script is used to find which tilenums are part of an actors animations.
 It relies on the output of get_con_instances.sh for defined names and variables.
-It outputs a single pickle file containing a numpy array of size MAXTILES, and reports unused actions, ai, etc.
+It outputs a single indicator store file containing an array of size MAXTILES, and reports unused actions, ai, etc.
 """
 import os
 import re
 import sys
 import nltk
 import numpy as np
-import pickle
 #nltk.download('punkt')
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from indicator_store import write_indicator
+
 CODE_DIR:str = ""
 MAXTILES:int = -1
 
@@ -31,8 +33,8 @@ else:
     exit(2)
 
 
-actor_frame_array = np.zeros(MAXTILES)
-outfile = "./actor_frame.pkl"
+actor_frame_array = np.zeros(MAXTILES, dtype=bool)
+outfile = "./actor_frame.bits"
 
 action_defs = dict()
 ai_defs = dict()
@@ -367,9 +369,8 @@ def main():
     print(f"Unused Actions: {unused_actions}")
     print(f"Number of Unused Actions: {len(unused_actions)}")
     print(f"Number of tiles that are part of actor frames: {np.count_nonzero(actor_frame_array)}")
-    with open(outfile, "wb") as fd:
-        pickle.dump(actor_frame_array, fd, pickle.HIGHEST_PROTOCOL)
-        print(f"Actor frame array written to: '{outfile}'")
+    write_indicator(outfile, actor_frame_array, provenance=f"get_actor_stats.py {CODE_DIR}")
+    print(f"Actor frame array written to: '{outfile}'")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,16 +2,18 @@
 # Author: Dino Bollinger
 # Licensed under BSD 3-Clause License, see included LICENSE file
 """
-This script outputs a pickled numpy array indicating which indices are non-empty tiles.
+This script outputs an indicator store file indicating which indices are non-empty tiles.
 """
 
 import os
 import re
 import sys
-import pickle
 import numpy as np
 
-outfilename = "./non_empty.pkl"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from indicator_store import write_indicator
+
+outfilename = "./non_empty.bits"
 
 MAXTILES:int = -1
 if len(sys.argv) >= 2:
@@ -20,7 +22,7 @@ else:
     print("Must specify maxtiles a first argument!", file=sys.stderr)
     exit(1)
 
-indicator = np.zeros(MAXTILES)
+indicator = np.zeros(MAXTILES, dtype=bool)
 
 tile_dir = "./tiles"
 filename_prefix = "tile"
@@ -35,6 +37,5 @@ for i in image_filenames:
     indicator[tile_num] = 1
 
 print(f"Total number of tiles in ART: {np.count_nonzero(indicator)}")
-with open(outfilename, "wb") as fd:
-    pickle.dump(indicator, fd, pickle.HIGHEST_PROTOCOL)
-    print(f"Indicator array written to '{outfilename}'")
+write_indicator(outfilename, indicator, provenance=f"get_nonempty_old.py {tile_dir}")
+print(f"Indicator array written to '{outfilename}'")
@@ -4,17 +4,19 @@
 """
 names_parser.py <maxtiles>
 Parses names.h and namesdyn.h of the Duke3D source and finds all actual usages of the contained tile definitions.
-This is output as a pickled numpy arrays and as individual csv files. Individual usage lines are also reported.
+This is output as an indicator store file and as individual csv files. Individual usage lines are also reported.
 The resulting output is a csv with markers for which tiles have hardcoded behavior, and which do not. (1/0)
 Usage: namesh_parser.py
 """
 import sys
 import os
 import subprocess
-import pickle
 
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from indicator_store import write_indicator
+
 # Output directory for all reports
 output_dir = "./namesh_report"
 
@@ -102,7 +104,7 @@ def main() -> int:
         sys.exit(1)
 
     maxtiles = int(sys.argv[1])
-    data_array = np.zeros(maxtiles)
+    data_array = np.zeros(maxtiles, dtype=np.uint8)
     os.makedirs(output_dir, exist_ok=True)
 
     infile = "./source/duke3d/src/names.h"
@@ -149,11 +151,10 @@ def main() -> int:
             fd.write(f"{tile_num}, {used}, {'::'.join(names)}\n")
     print(f"Combined report written to {cb}")
 
-    #output data array of size maxtiles as a pickle file
-    pkl_path = os.path.join(output_dir, "hardcoded.pkl")
-    with open(pkl_path, 'wb') as fd:
-        pickle.dump(data_array, fd, pickle.HIGHEST_PROTOCOL)
-    print(f"Pickled filter array written to {pkl_path}")
+    #output data array of size maxtiles as an indicator store file
+    out_path = os.path.join(output_dir, "hardcoded.bits")
+    write_indicator(out_path, data_array, provenance="hardcoded_names_parser.py names.h namesdyn.h")
+    print(f"Filter array written to {out_path}")
 
     return 0
 
@@ -2,13 +2,16 @@
 # Author: Dino Bollinger
 # Licensed under BSD 3-Clause License, see included LICENSE file
 """
-Retrieves statistics on which tile indices have associated voxels, and outputs a pickled indicator numpy array.
+Retrieves statistics on which tile indices have associated voxels, and outputs an indicator store file.
 """
 
 import sys
+import os
 import re
 import numpy as np
-import pickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from indicator_store import write_indicator
 
 # expected format:
 # voxel <path> { scale 1 tile 18128 }
@@ -27,7 +30,7 @@ else:
     print("Must specify maxtiles as second argument (int)!", file=sys.stderr)
     exit(2)
 
-voxel_tiles = np.zeros(MAXTILES)
+voxel_tiles = np.zeros(MAXTILES, dtype=bool)
 
 with open(DEF_DIR, "r") as fd:
     for line in fd:
@@ -36,9 +39,8 @@ with open(DEF_DIR, "r") as fd:
             tilenum = int(match.group(1))
             voxel_tiles[tilenum] = 1
 
-outfile = "./voxel.pkl"
+outfile = "./voxel.bits"
 
 print(f"Number of voxel tiles: {np.count_nonzero(voxel_tiles)}")
-with open(outfile, "wb") as fd:
-    pickle.dump(voxel_tiles, fd, pickle.HIGHEST_PROTOCOL)
-    print(f"Spawned tile array written to: '{outfile}'")
+write_indicator(outfile, voxel_tiles, provenance=f"list_voxels.py {DEF_DIR}")
+print(f"Spawned tile array written to: '{outfile}'")
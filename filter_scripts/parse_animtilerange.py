@@ -11,12 +11,15 @@
   to report animtile ranges, and non-empty tile slots.
 
   It can also be used to determine which tiles are used as tilefromtexture normally.
-  Results are dumped as pickled numpy arrays.
+  Results are dumped as indicator store files.
   """
 
 import sys
+import os
 import numpy as np
-import pickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from indicator_store import write_indicator
 
 # format:
 # tilefromtexture 12007 { file "12007.png" xoffset 0 yoffset 0 ifcrc -460055260 }
@@ -36,8 +39,8 @@ else:
     print("Must specify maxtiles as second argument (int)!", file=sys.stderr)
     exit(2)
 
-nonempty_tiles = np.zeros(MAXTILES)
-animtiles = np.zeros(MAXTILES)
+nonempty_tiles = np.zeros(MAXTILES, dtype=bool)
+animtiles = np.zeros(MAXTILES, dtype=bool)
 
 with open(DEF_DIR, "r") as fd:
     for line in fd:
@@ -51,16 +54,14 @@ with open(DEF_DIR, "r") as fd:
             end = int(line.strip().split()[2]) + 1
             animtiles[start:end] = 1
 
-outfile1 = "nonempty.pkl"
-outfile2 = "animation.pkl"
+outfile1 = "nonempty.bits"
+outfile2 = "animation.bits"
 
 print(f"Number of nonempty tiles: {np.count_nonzero(nonempty_tiles)}")
-with open(outfile1, "wb") as fd:
-    pickle.dump(nonempty_tiles, fd, pickle.HIGHEST_PROTOCOL)
-    print(f"Spawned tile array written to: '{outfile1}'")
+write_indicator(outfile1, nonempty_tiles, provenance=f"parse_animtilerange.py {DEF_DIR}")
+print(f"Spawned tile array written to: '{outfile1}'")
 
 print(f"Number of animated tiles: {np.count_nonzero(animtiles)}")
-with open(outfile2, "wb") as fd:
-    pickle.dump(animtiles, fd, pickle.HIGHEST_PROTOCOL)
-    print(f"Spawned tile array written to: '{outfile2}'")
+write_indicator(outfile2, animtiles, provenance=f"parse_animtilerange.py {DEF_DIR}")
+print(f"Spawned tile array written to: '{outfile2}'")
 
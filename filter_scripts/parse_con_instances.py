@@ -6,7 +6,7 @@ Parse extracted CON command instances to retrieve indicator arrays for use in fi
 This is a static analysis script and hence make use of the values stored in gamevars. Only constants and names are counted, the rest is filtered.
 This python script relies on the output of the `get_con_instances.sh` bash script.
 ----------------------------------------------------------------------------------------
-The following arrays are constructed, and output as pickle files:
+The following arrays are constructed, and output as indicator store files:
  > actor tile array: binary numpy array which marks every tile that is defined as an actor.
  > spawned tile array: binary numpy array which marks each tile that is either spawned or created using cactor.
  > projectile array: binary numpy array, marks every tile defined as a projectile
@@ -21,7 +21,9 @@ import sys
 import re
 import os
 import numpy as np
-import pickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from indicator_store import write_indicator
 
 MAXTILES=-1
 if len(sys.argv) >= 2:
@@ -33,10 +35,10 @@ else:
 defined_names = dict()
 defined_vars = set()
 
-actor_tiles = np.zeros(MAXTILES)
-spawned_tiles = np.zeros(MAXTILES)
-projectiles = np.zeros(MAXTILES)
-screen_tiles = np.zeros(MAXTILES)
+actor_tiles = np.zeros(MAXTILES, dtype=bool)
+spawned_tiles = np.zeros(MAXTILES, dtype=bool)
+projectiles = np.zeros(MAXTILES, dtype=bool)
+screen_tiles = np.zeros(MAXTILES, dtype=bool)
 
 
 def get_tilenum_for_name(name, line=None):
@@ -79,7 +81,7 @@ def clean_line(line):
 
 def main():
     """
-    Parse the outputs of the bash script and output pickled numpy indicator arrays.
+    Parse the outputs of the bash script and output indicator arrays in the indicator store format.
     """
     # Load name definitions for lookup purposes
     with open("./statistics/defs.txt", "r") as fd:
@@ -290,31 +292,27 @@ def main():
 
     os.makedirs("./pickled_stats/", exist_ok=True)
 
-    # dump the collected stats into pickled numpy arrays on disk
-    outfile1 = "./pickled_stats/actor.pkl"
-    outfile2 = "./pickled_stats/spawned.pkl"
-    outfile3 = "./pickled_stats/projectile.pkl"
-    outfile4 = "./pickled_stats/screentile.pkl"
+    # dump the collected stats into indicator store files on disk
+    outfile1 = "./pickled_stats/actor.bits"
+    outfile2 = "./pickled_stats/spawned.bits"
+    outfile3 = "./pickled_stats/projectile.bits"
+    outfile4 = "./pickled_stats/screentile.bits"
 
     print(f"Number of distinct actor tiles: {np.count_nonzero(actor_tiles)}")
-    with open(outfile1, "wb") as fd:
-        pickle.dump(actor_tiles, fd, pickle.HIGHEST_PROTOCOL)
-        print(f"Actor tile array written to: '{outfile1}'")
+    write_indicator(outfile1, actor_tiles, provenance="parse_con_instances.py")
+    print(f"Actor tile array written to: '{outfile1}'")
 
     print(f"Number of distinct spawned tiles: {np.count_nonzero(spawned_tiles)}")
-    with open(outfile2, "wb") as fd:
-        pickle.dump(spawned_tiles, fd, pickle.HIGHEST_PROTOCOL)
-        print(f"Spawned tile array written to: '{outfile2}'")
+    write_indicator(outfile2, spawned_tiles, provenance="parse_con_instances.py")
+    print(f"Spawned tile array written to: '{outfile2}'")
 
     print(f"Number of projectiles: {np.count_nonzero(projectiles)}")
-    with open(outfile3, "wb") as fd:
-        pickle.dump(projectiles, fd, pickle.HIGHEST_PROTOCOL)
-        print(f"Projectile array written to: '{outfile3}'")
+    write_indicator(outfile3, projectiles, provenance="parse_con_instances.py")
+    print(f"Projectile array written to: '{outfile3}'")
 
     print(f"Number of screen tiles: {np.count_nonzero(screen_tiles)}")
-    with open(outfile4, "wb") as fd:
-        pickle.dump(screen_tiles, fd, pickle.HIGHEST_PROTOCOL)
-        print(f"Screen tile array written to: '{outfile4}'")
+    write_indicator(outfile4, screen_tiles, provenance="parse_con_instances.py")
+    print(f"Screen tile array written to: '{outfile4}'")
 
     return 0
 
@@ -0,0 +1,172 @@
+#!/bin/python3
+# Author: Dino Bollinger
+# Licensed under BSD 3-Clause License, see included LICENSE file
+""" Indicator Store
+Compact on-disk format for the filter arrays in extra_input, as written by the scripts in filter_scripts.
+Each file stores a single indicator array of size maxtiles as bit planes packed with np.packbits,
+preceded by a JSON header with the name, maxtiles, number of bit planes, provenance and creation time.
+Most filters only use the values 0 and 1, and hence consist of a single bit plane.
+
+Files are memory-mapped, and only decoded once the array is accessed.
+The legacy pickled numpy arrays are still supported, but are loaded immediately.
+------------------------------------------------------------------------------------------
+Usage: indicator_store.py <pklfile> <outfile> [<name>]
+    Converts a legacy pickled indicator array into the indicator store format.
+"""
+
+import sys
+import os
+import json
+import pickle
+import datetime
+
+import numpy as np
+
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional
+
+# file extension of the indicator store format
+INDICATOR_EXT = ".bits"
+
+# dtype of the decoded indicator arrays
+INDICATOR_DTYPE = np.uint8
+
+# file layout: magic, header length as little endian uint32, JSON header, padding to 8 bytes, bit planes
+INDICATOR_MAGIC = b"EDIND\x00\x01\n"
+
+
+def write_indicator(path: str, values: np.ndarray, name: Optional[str] = None, provenance: str = "") -> None:
+    """
+    Writes an indicator array in the indicator store format.
+    :param path: Output file path, should end with INDICATOR_EXT.
+    :param values: Indicator array of size maxtiles, with integer values between 0 and 255.
+    :param name: Name of the filter, defaults to the file name without extension.
+    :param provenance: Describes how the array was created, e.g. the script and its input files.
+    """
+    values = np.asarray(values)
+    if values.ndim != 1:
+        raise ValueError(f"Indicator array must be one-dimensional, but has shape {values.shape}")
+    if not np.array_equal(values, values.astype(INDICATOR_DTYPE)):
+        raise ValueError("Indicator array may only contain integer values between 0 and 255")
+    values = values.astype(INDICATOR_DTYPE)
+
+    bits = max(int(values.max()).bit_length(), 1) if values.size > 0 else 1
+    planes = np.stack([np.packbits((values >> b) & 1) for b in range(bits)])
+    header = json.dumps({"name": name if name is not None else os.path.splitext(os.path.basename(path))[0],
+                         "maxtiles": int(values.size), "bits": bits, "provenance": provenance,
+                         "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")}).encode()
+    header += b" " * (-(len(INDICATOR_MAGIC) + 4 + len(header)) % 8)
+
+    with open(path, "wb") as fd:
+        fd.write(INDICATOR_MAGIC)
+        fd.write(len(header).to_bytes(4, "little"))
+        fd.write(header)
+        fd.write(planes.tobytes())
+
+
+class Indicator:
+    """
+    A single indicator array. The header is read on construction, the bit planes are memory-mapped
+    and decoded on first access of `values`. The decoded array is read-only, as it is shared by all users.
+    """
+    __slots__ = ("path", "header", "_offset", "_values")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._values: Optional[np.ndarray] = None
+        with open(path, "rb") as fd:
+            if fd.read(len(INDICATOR_MAGIC)) != INDICATOR_MAGIC:
+                raise ValueError(f"'{path}' is not an indicator store file")
+            length = int.from_bytes(fd.read(4), "little")
+            self.header: dict = json.loads(fd.read(length).decode())
+        self._offset = len(INDICATOR_MAGIC) + 4 + length
+
+    @classmethod
+    def from_array(cls, path: str, values: np.ndarray, header: dict) -> "Indicator":
+        """ Wraps an array that has already been loaded, e.g. from a legacy pickle file. """
+        indicator = cls.__new__(cls)
+        indicator.path = path
+        indicator.header = header
+        indicator._offset = 0
+        indicator._values = values.astype(INDICATOR_DTYPE)
+        indicator._values.setflags(write=False)
+        return indicator
+
+    @property
+    def name(self) -> str:
+        return self.header["name"]
+
+    @property
+    def maxtiles(self) -> int:
+        return self.header["maxtiles"]
+
+    @property
+    def values(self) -> np.ndarray:
+        if self._values is None:
+            nbytes = (self.maxtiles + 7) // 8
+            planes = np.memmap(self.path, dtype=np.uint8, mode="r", offset=self._offset, shape=(self.header["bits"], nbytes))
+            values = np.zeros(self.maxtiles, dtype=INDICATOR_DTYPE)
+            for b in range(planes.shape[0]):
+                values |= np.unpackbits(planes[b], count=self.maxtiles) << b
+            del planes
+            values.setflags(write=False)
+            self._values = values
+        return self._values
+
+
+def load_legacy_indicator(path: str) -> Indicator:
+    """ Loads a pickled numpy indicator array, as written by earlier versions of the filter scripts. """
+    with open(path, "rb") as fd:
+        loaded_arr = pickle.load(fd)
+    if type(loaded_arr) != np.ndarray or loaded_arr.ndim != 1:
+        raise ValueError(f"Extra stats file '{path}' does not contain a valid ndarray!")
+    elif not np.array_equal(loaded_arr, loaded_arr.astype(INDICATOR_DTYPE)):
+        raise ValueError(f"Extra stats array '{path}' does not contain indicator values between 0 and 255!")
+    header = {"name": os.path.splitext(os.path.basename(path))[0], "maxtiles": loaded_arr.shape[0],
+              "bits": None, "provenance": f"legacy pickle {path}", "created": None}
+    return Indicator.from_array(path, loaded_arr, header)
+
+
+class IndicatorStore(Mapping):
+    """
+    Read-only mapping of column names to indicator arrays. Arrays are only decoded when they are looked up.
+    Files ending with INDICATOR_EXT are memory-mapped, all other files are treated as legacy pickles.
+    """
+
+    def __init__(self, paths: Dict[str, str], maxtiles: int):
+        """
+        :param paths: column name to file path
+        :param maxtiles: expected size of all arrays
+        """
+        self.indicators: Dict[str, Indicator] = dict()
+        for k, v in paths.items():
+            print(f"Using extra stats file: {v}")
+            indicator = Indicator(v) if v.endswith(INDICATOR_EXT) else load_legacy_indicator(v)
+            if indicator.maxtiles != maxtiles:
+                raise ValueError(f"Size of extra stats array '{v}' is '({indicator.maxtiles},)', but maxtiles specified as '{maxtiles}'!")
+            self.indicators[k] = indicator
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.indicators[name].values
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.indicators)
+
+    def __len__(self) -> int:
+        return len(self.indicators)
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: indicator_store.py <pklfile> <outfile> [<name>]", file=sys.stderr)
+        return 1
+    indicator = load_legacy_indicator(sys.argv[1])
+    name = sys.argv[3] if len(sys.argv) >= 4 else None
+    write_indicator(sys.argv[2], indicator.values, name=name, provenance=f"converted from {sys.argv[1]}")
+    print(f"Indicator array written to '{sys.argv[2]}'")
+    return 0
+
+
+if __name__ == "__main__":
+    exit_code = main()
+    exit(exit_code)
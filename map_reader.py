@@ -0,0 +1,141 @@
+#!/bin/python3
+# Author: Dino Bollinger
+# Licensed under BSD 3-Clause License, see included LICENSE file
+""" Build MAP Reader
+Reads Build engine MAP files of versions 7 to 9, as used by Duke Nukem 3D and EDuke32, without mapster32.
+The sector, wall and sprite records are loaded as NumPy structured arrays straight from the file contents,
+without converting individual records. Versions 7 to 9 share the same record layout, and only differ in
+the maximum number of sectors, walls and sprites.
+
+File layout, all values little endian:
+    int32 version, int32 x, y, z, int16 angle, int16 cursectnum     player start
+    uint16 numsectors, followed by numsectors sector records (40 bytes each)
+    uint16 numwalls, followed by numwalls wall records (32 bytes each)
+    uint16 numsprites, followed by numsprites sprite records (44 bytes each)
+"""
+
+import numpy as np
+
+from typing import Optional, Tuple, Union
+
+# supported map versions, and their maximum number of sectors, walls and sprites
+map_limits = {7: (1024, 8192, 4096), 8: (4096, 16384, 16384), 9: (4096, 16384, 16384)}
+
+# sprites with this statnum have been deleted
+MAXSTATUS = 1024
+
+HEADER_DTYPE = np.dtype([("version", "<i4"), ("x", "<i4"), ("y", "<i4"), ("z", "<i4"),
+                         ("angle", "<i2"), ("cursectnum", "<i2")])
+
+SECTOR_DTYPE = np.dtype([("wallptr", "<i2"), ("wallnum", "<i2"), ("ceilingz", "<i4"), ("floorz", "<i4"),
+                         ("ceilingstat", "<u2"), ("floorstat", "<u2"),
+                         ("ceilingpicnum", "<i2"), ("ceilingheinum", "<i2"), ("ceilingshade", "i1"),
+                         ("ceilingpal", "u1"), ("ceilingxpanning", "u1"), ("ceilingypanning", "u1"),
+                         ("floorpicnum", "<i2"), ("floorheinum", "<i2"), ("floorshade", "i1"),
+                         ("floorpal", "u1"), ("floorxpanning", "u1"), ("floorypanning", "u1"),
+                         ("visibility", "u1"), ("fogpal", "u1"),
+                         ("lotag", "<u2"), ("hitag", "<i2"), ("extra", "<i2")])
+
+WALL_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("point2", "<i2"), ("nextwall", "<i2"), ("nextsector", "<i2"),
+                       ("cstat", "<u2"), ("picnum", "<i2"), ("overpicnum", "<i2"), ("shade", "i1"), ("pal", "u1"),
+                       ("xrepeat", "u1"), ("yrepeat", "u1"), ("xpanning", "u1"), ("ypanning", "u1"),
+                       ("lotag", "<i2"), ("hitag", "<i2"), ("extra", "<i2")])
+
+SPRITE_DTYPE = np.dtype([("x", "<i4"), ("y", "<i4"), ("z", "<i4"), ("cstat", "<u2"), ("picnum", "<i2"),
+                         ("shade", "i1"), ("pal", "u1"), ("clipdist", "u1"), ("blend", "u1"),
+                         ("xrepeat", "u1"), ("yrepeat", "u1"), ("xoffset", "i1"), ("yoffset", "i1"),
+                         ("sectnum", "<i2"), ("statnum", "<i2"), ("ang", "<i2"), ("owner", "<i2"),
+                         ("xvel", "<i2"), ("yvel", "<i2"), ("zvel", "<i2"),
+                         ("lotag", "<i2"), ("hitag", "<i2"), ("extra", "<i2")])
+
+assert SECTOR_DTYPE.itemsize == 40 and WALL_DTYPE.itemsize == 32 and SPRITE_DTYPE.itemsize == 44
+
+
+class BuildMap:
+    """
+    Sectors, walls and sprites of a single map, as read-only structured arrays that share the memory of the
+    buffer the map was read from. Sprites that mapster32 removes when loading the map, i.e. deleted sprites
+    and sprites outside of any sector, are not included in `sprites`, but counted in `removed_sprites`.
+    """
+    __slots__ = ("path", "version", "start", "sectors", "walls", "sprites", "removed_sprites")
+
+    def __init__(self, path: str, version: int, start: np.void, sectors: np.ndarray, walls: np.ndarray,
+                 sprites: np.ndarray, removed_sprites: int = 0):
+        self.path = path
+        self.version = version
+        self.start = start
+        self.sectors = sectors
+        self.walls = walls
+        self.sprites = sprites
+        self.removed_sprites = removed_sprites
+
+    @property
+    def status(self) -> str:
+        """ Load status in the format of the mapster32 log, see mapload_pattern in asset_parser.py. """
+        return f"(removed {self.removed_sprites} sprites)" if self.removed_sprites > 0 else "successfully"
+
+    def __repr__(self) -> str:
+        return (f"BuildMap({self.path!r}, version={self.version}, sectors={len(self.sectors)}, "
+                f"walls={len(self.walls)}, sprites={len(self.sprites)})")
+
+
+def read_map(source: Union[str, bytes, bytearray, memoryview], path: Optional[str] = None) -> BuildMap:
+    """
+    Reads a MAP file of version 7 to 9.
+    :param source: path of the map file, or a bytes-like object with its contents, e.g. an mmap.
+                   The arrays of the map are views into the buffer, which is not copied.
+    :param path: name of the map, defaults to the source path
+    :return: BuildMap with the records of the map
+    """
+    if isinstance(source, str):
+        path = source if path is None else path
+        with open(source, "rb") as fd:
+            source = fd.read()
+    path = "<buffer>" if path is None else path
+    buf = memoryview(source).cast("B")
+
+    def records(dtype: np.dtype, offset: int) -> Tuple[np.ndarray, int]:
+        if offset + 2 > len(buf):
+            raise ValueError(f"Map '{path}' is truncated")
+        count = int.from_bytes(buf[offset:offset + 2], "little")
+        end = offset + 2 + count * dtype.itemsize
+        if end > len(buf):
+            raise ValueError(f"Map '{path}' is truncated, expected {count} records of {dtype.itemsize} bytes")
+        return np.frombuffer(buf, dtype=dtype, count=count, offset=offset + 2), end
+
+    if len(buf) < HEADER_DTYPE.itemsize:
+        raise ValueError(f"Map '{path}' is truncated")
+    start = np.frombuffer(buf, dtype=HEADER_DTYPE, count=1)[0]
+    version = int(start["version"])
+    if version not in map_limits:
+        raise ValueError(f"Map '{path}' has unsupported version {version}, expected one of {', '.join(map(str, map_limits))}")
+
+    sectors, offset = records(SECTOR_DTYPE, HEADER_DTYPE.itemsize)
+    walls, offset = records(WALL_DTYPE, offset)
+    sprites, offset = records(SPRITE_DTYPE, offset)
+    for name, arr, limit in zip(("sectors", "walls", "sprites"), (sectors, walls, sprites), map_limits[version]):
+        if len(arr) > limit:
+            raise ValueError(f"Map '{path}' has {len(arr)} {name}, but version {version} allows at most {limit}")
+
+    kept = (sprites["statnum"] != MAXSTATUS) & (sprites["sectnum"] >= 0) & (sprites["sectnum"] < len(sectors))
+    removed = len(sprites) - int(np.count_nonzero(kept))
+    if removed > 0:
+        sprites = sprites[kept]
+    return BuildMap(path, version, start, sectors, walls, sprites, removed)
+
+
+def tile_picnums(build_map: BuildMap) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the picnums of the map in the order in which dump_used_assets.m32 reports them: the sprites,
+    then the floor and ceiling of each sector, then the wall and overwall of each wall.
+    :param build_map: map as returned by read_map
+    :return: Tuple: (codes, picnums), both int64 arrays. The codes are the category indices in the order
+             sprite, floor, ceiling, wall, overwall, as in tile_categories of asset_parser.py.
+    """
+    sectors, walls = build_map.sectors, build_map.walls
+    picnums = np.concatenate([build_map.sprites["picnum"],
+                              np.column_stack((sectors["floorpicnum"], sectors["ceilingpicnum"])).reshape(-1),
+                              np.column_stack((walls["picnum"], walls["overpicnum"])).reshape(-1)]).astype(np.int64)
+    codes = np.concatenate([np.zeros(len(build_map.sprites), dtype=np.int64),
+                            np.tile(np.array([1, 2]), len(sectors)), np.tile(np.array([3, 4]), len(walls))])
+    return codes, picnums
@@ -0,0 +1,136 @@
+#!/bin/python3
+# Author: Dino Bollinger
+# Licensed under BSD 3-Clause License, see included LICENSE file
+""" Result Cache
+Persistent cache of the statistics of single maps, keyed by a hash of the map contents rather than its name.
+The contents are either the bytes of a MAP file, or the tile and sound blocks of a map in the mapster32 log.
+Maps that are shared between map packs under different names, or that are loaded again in a later log,
+are hence only counted once.
+
+The records are stored in an SQLite database. Each record holds the tile statistics, sound counts and rejects
+of one map as plain tuples, strings and arrays, such that they can be read regardless of the module that
+defines the statistics classes, and the version of the record format. Records of other versions are ignored
+and removed, records that cannot be read are treated as missing and replaced.
+Once the records exceed the size limit, the least recently used ones are evicted when the cache is closed.
+The settings that affect the counts, such as maxtiles, are hashed into the key, so runs with other settings
+do not share records.
+"""
+
+import hashlib
+import pickle
+import sqlite3
+
+from typing import Iterable, Optional, Tuple
+
+# Version of the cached records. Records of other versions are ignored, and removed on eviction.
+CACHE_VERSION = 2
+
+# default size limit of the cache, in bytes of stored records
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key BLOB PRIMARY KEY,       -- content hash, see ResultCache.key
+    version INTEGER NOT NULL,   -- CACHE_VERSION of the record
+    size INTEGER NOT NULL,      -- length of data in bytes
+    last_used INTEGER NOT NULL, -- access counter, the lowest values are evicted first
+    data BLOB NOT NULL          -- pickled tuple of plain values, see MapStatsParser._to_plain_record
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_by_use ON results (last_used);
+"""
+
+
+class ResultCache:
+    """
+    Content-addressed store of the statistics of single maps. Lookups and insertions are done in one transaction,
+    which is committed when the cache is closed. Warnings about rejected tiles and sounds are printed when
+    a map is counted, and not again when its statistics are taken from the cache.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param path: path of the cache database, created if it does not exist
+        :param max_bytes: size limit of the records, enforced when the cache is closed
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.executescript(CACHE_SCHEMA)
+        self.clock = self.db.execute("SELECT COALESCE(MAX(last_used), 0) FROM results").fetchone()[0]
+        self.db.execute("BEGIN")
+
+    @staticmethod
+    def key(settings: Tuple, buffers: Iterable) -> bytes:
+        """
+        Hashes the contents of a map together with the settings they were counted with.
+        :param settings: origin of the contents and the settings that affect the counts, e.g.
+                         ("log", maxtiles, maxsounds, skip_overwall0). Hashed by their repr.
+        :param buffers: bytes-like objects with the contents of the map, each is hashed with its length
+        """
+        h = hashlib.blake2b(repr(settings).encode(), digest_size=20)
+        for buf in buffers:
+            buf = memoryview(buf)
+            h.update(buf.nbytes.to_bytes(8, "little"))
+            h.update(buf)
+        return h.digest()
+
+    def get(self, key: bytes) -> Optional[tuple]:
+        """
+        Returns the record stored under the key, or None if there is none or it cannot be unpickled.
+        Marks the record as recently used.
+        """
+        row = self.db.execute("SELECT data FROM results WHERE key = ? AND version = ?", (key, CACHE_VERSION)).fetchone()
+        try:
+            value = pickle.loads(row[0]) if row is not None else None
+        except Exception:
+            # e.g. written by another version of a module it refers to, replaced once the map is counted again
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.clock += 1
+        self.db.execute("UPDATE results SET last_used = ? WHERE key = ?", (self.clock, key))
+        return value
+
+    def put(self, key: bytes, value: tuple) -> None:
+        """ Stores the record of a map, replacing an existing one. The value should only contain plain types and arrays. """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.clock += 1
+        self.db.execute("INSERT OR REPLACE INTO results (key, version, size, last_used, data) VALUES (?, ?, ?, ?, ?)",
+                        (key, CACHE_VERSION, len(data), self.clock, data))
+
+    def evict(self) -> int:
+        """
+        Removes the records of other versions, then the least recently used records until the size limit is met.
+        :return: number of removed records
+        """
+        removed = self.db.execute("DELETE FROM results WHERE version != ?", (CACHE_VERSION,)).rowcount
+        excess = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0] - self.max_bytes
+        if excess > 0:
+            keys = []
+            for key, size in self.db.execute("SELECT key, size FROM results ORDER BY last_used"):
+                keys.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self.db.executemany("DELETE FROM results WHERE key = ?", keys)
+            removed += len(keys)
+        return removed
+
+    def close(self) -> None:
+        """ Evicts records over the size limit, and commits all changes. """
+        if self.db is None:
+            return
+        self.evict()
+        self.db.execute("COMMIT")
+        self.db.close()
+        self.db = None
+
+    def __enter__(self) -> "ResultCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
@@ -0,0 +1,136 @@
+#!/bin/python3
+# Author: Dino Bollinger
+# Licensed under BSD 3-Clause License, see included LICENSE file
+""" Sound Rules
+Reimplements the `sound_search` state of `dump_used_assets.m32` on the records of a map read by map_reader.py.
+Each rule of the script is evaluated with NumPy masks over all sprites, sectors or walls of the map at once.
+The picnums of the actors and tiles the rules refer to are taken from the names.h of the game.
+
+The hits are returned in the order in which the script writes them to the log, such that counting them
+gives the same counts and rejects as parsing the verbose log.
+"""
+
+import re
+
+import numpy as np
+
+from typing import Dict, Tuple, Union
+
+# emitter codes, in the order of quotes 21-28 of dump_used_assets.m32, as sound_emitters in asset_parser.py
+TRIGGERED, AMBIENT, ONE_TIME, MIKE, SWITCH, MIRROR, SECTOR_65534, DOORTILE = range(8)
+
+# picnums of switch_identify in dump_used_assets.m32. Switches whose hitag selects a multi-switch
+# combination instead of a sound are commented out in the script, and hence not listed.
+switch_tiles = ("ACCESSSWITCH", "SLOTDOOR", 133, "LIGHTSWITCH", 135, "SPACEDOORSWITCH", 137,
+                "SPACELIGHTSWITCH", 139, "FRANKENSTINESWITCH", 141, "MULTISWITCH", 147, 148, 149,
+                "DIPSWITCH2", 165, "DIPSWITCH3", 169, "ACCESSSWITCH2", "LIGHTSWITCH2", 713,
+                "POWERSWITCH1", 861, "LOCKSWITCH1", 863, "POWERSWITCH2", 865, "HANDSWITCH", 1112, "PULLSWITCH", 1123)
+
+# picnums of doortile_identify in dump_used_assets.m32, DOORTILE13 is not included there
+doortile_tiles = tuple(f"DOORTILE{i}" for i in range(1, 24) if i != 13)
+
+define_pattern = re.compile(r"^\s*#define\s+([A-Za-z_][A-Za-z0-9_]*)\s+(-?[0-9]+)\b", re.MULTILINE)
+
+
+def load_names_h(path: str) -> Dict[str, int]:
+    """ Reads the `#define NAME number` lines of a names.h file. """
+    with open(path, "r", encoding="utf8", errors="replace") as fd:
+        return {name: int(value) for name, value in define_pattern.findall(fd.read())}
+
+
+class SoundRules:
+    """ The picnums required by the sound rules, resolved from a names.h table. """
+    __slots__ = ("musicandsfx", "mike", "mirror", "switches", "doortiles")
+
+    def __init__(self, names: Dict[str, int]):
+        """
+        :param names: names.h table, see load_names_h
+        """
+        required = ["MUSICANDSFX", "MIKE", "MIRROR"] + [t for t in switch_tiles + doortile_tiles if isinstance(t, str)]
+        missing = [n for n in required if n not in names]
+        if len(missing) > 0:
+            raise ValueError(f"names.h does not define {', '.join(missing)}")
+
+        def resolve(tile: Union[str, int]) -> int:
+            return names[tile] if isinstance(tile, str) else tile
+
+        self.musicandsfx = names["MUSICANDSFX"]
+        self.mike = names["MIKE"]
+        self.mirror = names["MIRROR"]
+        self.switches = np.unique([resolve(t) for t in switch_tiles])
+        self.doortiles = np.unique([resolve(t) for t in doortile_tiles])
+
+    @classmethod
+    def from_names_h(cls, path: str) -> "SoundRules":
+        return cls(load_names_h(path))
+
+    def __repr__(self) -> str:
+        return (f"SoundRules(musicandsfx={self.musicandsfx}, mike={self.mike}, mirror={self.mirror}, "
+                f"switches={self.switches.tolist()}, doortiles={self.doortiles.tolist()})")
+
+
+def _interleave(*columns: Tuple[int, np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Combines the hits of a rule that writes several lines per record, in record order.
+    :param columns: (emitter code, sound numbers, mask) for each line the rule may write per record
+    :return: Tuple: (codes, numbers) of the hits
+    """
+    numbers = np.column_stack([np.asarray(n, dtype=np.int64) for _, n, _ in columns]).reshape(-1)
+    mask = np.column_stack([m for _, _, m in columns]).reshape(-1)
+    codes = np.tile(np.array([c for c, _, _ in columns], dtype=np.int64), len(mask) // len(columns))
+    return codes[mask], numbers[mask]
+
+
+def sound_hits(build_map, rules: SoundRules) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluates the rules of the sound_search state of dump_used_assets.m32 on the map.
+    :param build_map: map as returned by map_reader.read_map
+    :param rules: picnums of the rules
+    :return: Tuple: (codes, numbers), both int64 arrays with one entry per log line the script would write.
+             The codes are the emitter codes defined above.
+    """
+    sprites, sectors, walls = build_map.sprites, build_map.sectors, build_map.walls
+    spicnum, slotag, shitag = sprites["picnum"], sprites["lotag"].astype(np.int64), sprites["hitag"].astype(np.int64)
+    sector_lotag = sectors["lotag"].astype(np.int64)
+    hits = []
+
+    # MUSICANDSFX below lotag 1000 (echo effects), triggered if the lotag of their sector is within [1, 10000)
+    sfx = (spicnum == rules.musicandsfx) & (slotag < 1000)
+    lotag, hitag = slotag[sfx], shitag[sfx]
+    sect_lotag = sector_lotag[sprites["sectnum"][sfx]]
+    triggered = (sect_lotag != 0) & (sect_lotag < 10000)
+    lotag_sound = (lotag != 0) & (lotag < 500)
+    hits.append(_interleave((TRIGGERED, lotag, triggered & lotag_sound),
+                            (TRIGGERED, hitag, triggered & (hitag != 0) & (hitag < 500)),
+                            (AMBIENT, lotag, ~triggered & lotag_sound)))
+
+    # one-time sector sounds
+    one_time = (sector_lotag >= 10000) & (sector_lotag < 16383)
+    hits.append((np.full(np.count_nonzero(one_time), ONE_TIME), sector_lotag[one_time] - 10000))
+
+    # MIKE plays its hitag, including sound 0
+    mike = spicnum == rules.mike
+    hits.append((np.full(np.count_nonzero(mike), MIKE), shitag[mike]))
+
+    # switches with a hitag
+    switch = np.isin(spicnum, rules.switches) & (shitag != 0)
+    hits.append((np.full(np.count_nonzero(switch), SWITCH), shitag[switch]))
+
+    # mirrors play the lotag of the wall
+    mirror = ((walls["picnum"] == rules.mirror) | (walls["overpicnum"] == rules.mirror)) & (walls["lotag"] != 0)
+    hits.append((np.full(np.count_nonzero(mirror), MIRROR), walls["lotag"][mirror]))
+
+    # custom exit sound of sector lotag 65534
+    exit_sound = sector_lotag == 65534
+    hits.append((np.full(np.count_nonzero(exit_sound), SECTOR_65534), sectors["hitag"][exit_sound]))
+
+    # door tile sprites with a hitag, then door tile walls with a lotag and a hitag
+    door = np.isin(spicnum, rules.doortiles) & (shitag != 0)
+    hits.append((np.full(np.count_nonzero(door), DOORTILE), shitag[door]))
+    door = ((np.isin(walls["picnum"], rules.doortiles) | np.isin(walls["overpicnum"], rules.doortiles))
+            & (walls["lotag"] != 0) & (walls["hitag"] != 0))
+    hits.append((np.full(np.count_nonzero(door), DOORTILE), walls["hitag"][door]))
+
+    codes = np.concatenate([np.asarray(c, dtype=np.int64) for c, _ in hits])
+    numbers = np.concatenate([np.asarray(n, dtype=np.int64) for _, n in hits])
+    return codes, numbers
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from asset_parser import AssetIndex, MapStatsParser, query_index
+
+# the same map searched twice without a reload, followed by another map
+TWO_SEARCHES_LOG = """\
+Loaded V8 map maps/a.map successfully.
+Searching for tiles used in current map...
+sprite,5,
+wall,44,
+Tile search finished.
+Searching for sounds used in current map...
+switch,44,
+MUSICANDSFX ambient,3,
+Sound search finished.
+Search finished.
+Searching for tiles used in current map...
+sprite,5,
+Tile search finished.
+Searching for sounds used in current map...
+switch,44,
+doortile,70,
+Sound search finished.
+Search finished.
+Loaded V8 map maps/b.map successfully.
+Searching for tiles used in current map...
+floor,7,
+Tile search finished.
+Search finished.
+"""
+
+
+def test_stream_counts_repeated_searches(tmp_path):
+    log = tmp_path / "mapster32.log"
+    log.write_text(TWO_SEARCHES_LOG, encoding="utf8")
+
+    tiles, sounds = MapStatsParser.parse_log(str(log))
+    tile_stats, _ = MapStatsParser.aggregate_tilestats(tiles, 8192)
+    sound_stats, _ = MapStatsParser.aggregate_soundstats(sounds)
+    stream_tiles, _, stream_sounds, _ = MapStatsParser.parse_log_streaming(str(log), 8192)
+
+    assert stream_tiles["maps/a.map"]["sprite"][5] == 2
+    assert stream_sounds["maps/a.map"]["switch"][44] == 2
+    assert stream_tiles.keys() == tile_stats.keys()
+    for name in tile_stats:
+        for col in tile_stats[name]:
+            assert np.array_equal(stream_tiles[name][col], tile_stats[name][col])
+    assert stream_sounds.keys() == sound_stats.keys()
+    for name in sound_stats:
+        assert list(stream_sounds[name]) == list(sound_stats[name])
+        for col in sound_stats[name]:
+            assert np.array_equal(stream_sounds[name][col], sound_stats[name][col])
+
+
+@pytest.mark.parametrize("line", ["spritx,5,", "sprit,5,", "sprite5,", "sprite,12abc,", "sprite,,", "sprite,-,", "sprite,+5,"])
+def test_malformed_tile_lines_are_rejected(line):
+    with pytest.raises(ValueError):
+        MapStatsParser._tile_lines_to_arrays(["sprite,1,", line])
+
+
+def test_tile_indices_are_not_truncated():
+    codes, tidx = MapStatsParser._tile_lines_to_arrays(["wall,-3,", "floor,12345678901,", "overwall,99999999999999999999,"])
+    assert codes.tolist() == [3, 1, 4]
+    assert tidx[0] == -3 and tidx[1] == 12345678901
+    assert tidx[2] >= 8192
+
+
+def test_mmap_parse_error_is_not_hidden(tmp_path):
+    log = tmp_path / "mapster32.log"
+    log.write_text(TWO_SEARCHES_LOG.replace("sprite,5,", "sprte,5,", 1), encoding="utf8")
+    with pytest.raises(ValueError, match="sprte,5,"):
+        MapStatsParser.parse_log_mmap(str(log), 8192)
+
+
+def test_query_unused_sound_above_highest_used(tmp_path, capsys):
+    log = tmp_path / "mapster32.log"
+    log.write_text(TWO_SEARCHES_LOG, encoding="utf8")
+    tile_stats, _, sound_stats, _ = MapStatsParser.parse_log_streaming(str(log), 8192)
+    index_path = str(tmp_path / "asset_index.npz")
+    AssetIndex.build(tile_stats, sound_stats, 8192).save(index_path)
+    capsys.readouterr()
+
+    assert query_index(index_path, "sound", 16384, None) == 0
+    assert "No map uses sound 16384" in capsys.readouterr().out
+    assert query_index(index_path, "sound", 44, None) == 0
+    assert "sound 44: 2 uses in 1 maps" in capsys.readouterr().out